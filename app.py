@@ -13,16 +13,24 @@ from dash import (
     page_container,
 )
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
 import pandas as pd
-from scipy import stats
 import base64
+import hashlib
 import pickle
-import io
+import json
 import os
 import shutil
 import utils
+import instrumentation
+import bootstrap
+import coalesce
+import datastore
+import exports
+import ingest
+import reports
+import storage
+from storage import DATA_FOLDER, SAVED_FILE_NAMES, OPTIONAL_FILE_NAMES
 
 import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import load_figure_template
@@ -39,14 +47,15 @@ NEGATIVE = "#446e9b"
 UNKNOWN = "#999"
 THRESHOLD = "#d47500"
 
-SAVED_FILE_NAMES = {
-    "roc curves": "roc_curves.pkl",
-    "raw data": "raw_data.feather",
-    "labeled data": "labeled_data.pkl",
-    "parameter fitting": "fitted_params.pkl",
+STATFIT_LABELS = {
+    "norm": "Normal",
+    "gompertz": "Gompertz",
+    "expon": "Exponential",
+    "exponnorm": "Expon. Norm.",
 }
 
-DATA_FOLDER = "data"
+# tracing memory slows processing down, set VV_PROFILE_MEMORY=0 to only time it
+PROFILE_MEMORY = os.environ.get("VV_PROFILE_MEMORY", "1") != "0"
 
 app = Dash(
     __name__,
@@ -59,6 +68,8 @@ app = Dash(
     use_pages=True,
     suppress_callback_exceptions=True,
 )
+instrumentation.init_app(app.server)
+app.server.register_blueprint(exports.blueprint)
 
 navbar = dbc.NavbarSimple(
     children=[
@@ -123,12 +134,14 @@ alert_warning = html.Div(
 app.layout = html.Div(
     [
         html.Div(id="loadup-dummy"),
+        dcc.Store(id="session-id", storage_type="session"),
+        dcc.Store(id="roc-request-seq", storage_type="session"),
+        dcc.Store(id="graph-request-seq", storage_type="session"),
         dcc.Store(id="uploaded-files-list", data=[], storage_type="memory"),
         dcc.Store(id="processed-files-list", data=[], storage_type="memory"),
         dcc.Store(id="raw-data-for-grid", data={}, storage_type="memory"),
-        dcc.Store(id="labeled-data", data={}, storage_type="memory"),
+        dcc.Store(id="column-ranges", data={}, storage_type="memory"),
         dcc.Store(id="fit-params", data={}, storage_type="memory"),
-        dcc.Store(id="roc-curves", data={}, storage_type="memory"),
         dcc.Store(id="range-value", data=[None, None], storage_type="memory"),
         dcc.Store(id="graph-cache", data={}, storage_type="memory"),
         navbar,
@@ -165,13 +178,11 @@ def store_files(upload_contents, upload_filenames, uploaded_files_list):
                 errors.append(f"Error decoding Base64 string of file {filename}: {e}")
 
             try:
-                if filename.endswith(".tsv"):
-                    df_file = pd.read_csv(
-                        io.StringIO(decoded.decode("utf-8")), sep="\t"
-                    )
+                if ingest.file_format(filename) is not None:
+                    df_file = ingest.read_table(decoded, filename)
                 else:
                     errors.append(
-                        f"The filetype of {filename} is incorrect. Please upload a .tsv file."
+                        f"The filetype of {filename} is incorrect. Please upload a {ingest.supported_extensions()} file."
                     )
                     continue
 
@@ -195,26 +206,16 @@ def store_files(upload_contents, upload_filenames, uploaded_files_list):
             except Exception as e:
                 errors.append(f"An unexpected Error occured: {e}")
 
-            # If no errors, file is acceptable and save to /data/filename/
-            file_dir = os.path.join("data", filename)
+            # If no errors, file is acceptable, stage it for data_processing,
+            # which publishes it to /data/filename/
             if not errors:
-                os.makedirs(file_dir, exist_ok=True)
-                output_filepath = os.path.join(file_dir, filename)
-
                 try:
-                    with open(output_filepath, "wb") as file:
-                        file.write(decoded)
+                    storage.stage_upload(filename, decoded)
                     all_uploaded_files_list.append(filename)
                 except IOError as e:
                     errors.append(f"Error saving file {filename}: {e}")
-            else:
-                # delete file
+            elif filename in all_uploaded_files_list:
                 all_uploaded_files_list.remove(filename)
-                if os.path.exists(file_dir):
-                    try:
-                        shutil.rmtree(file_dir)
-                    except OSError as e:
-                        errors.append(f"Error: {file_dir} - {e.strerror}.")
 
     # Logic for alerts
     fail_is_open = len(errors) > 0
@@ -235,8 +236,7 @@ def store_files(upload_contents, upload_filenames, uploaded_files_list):
 # TODO: when files with same filename are uploaded they do not replace the existing file
 @callback(
     Output("processed-files-list", "data", allow_duplicate=True),
-    Output("labeled-data", "data", allow_duplicate=True),
-    Output("roc-curves", "data", allow_duplicate=True),
+    Output("column-ranges", "data", allow_duplicate=True),
     Output("fit-params", "data", allow_duplicate=True),
     Output("raw-data-for-grid", "data", allow_duplicate=True),
     Output("alert-fail", "is_open", allow_duplicate=True),
@@ -245,6 +245,7 @@ def store_files(upload_contents, upload_filenames, uploaded_files_list):
     State("processed-files-list", "data"),
     prevent_initial_call=True,
 )
+@instrumentation.instrument
 def data_processing(uploaded_files_list, processed_files_list):
     errors = []
     if not uploaded_files_list:
@@ -255,11 +256,9 @@ def data_processing(uploaded_files_list, processed_files_list):
             no_update,
             no_update,
             no_update,
-            no_update,
         )
 
-    new_labeled_data = {}
-    new_roc_curves = {}
+    new_column_ranges = {}
     new_fit_params = {}
     new_raw_data_for_grid = {}
     last_processed_file = None
@@ -267,39 +266,99 @@ def data_processing(uploaded_files_list, processed_files_list):
     finished_processed_files_list = processed_files_list if processed_files_list else []
 
     for filename in uploaded_files_list:
+        instrumentation.record_cache(filename in finished_processed_files_list)
         if filename not in finished_processed_files_list:
+            build_dir = None
             try:
-                file_dir = os.path.join("data", filename)
-                raw_file_path = os.path.join(file_dir, filename)
-
-                if filename.endswith(".tsv"):
-                    df = pd.read_csv(raw_file_path, sep="\t")
-
-                labeled_data = utils.label_data(df)
-                roc_curves = utils.make_roc_curve(labeled_data)
-                fitted_params = utils.fit_params(labeled_data)
-
-                labeled_data_filepath = os.path.join(
-                    file_dir, SAVED_FILE_NAMES["labeled data"]
-                )
-                with open(labeled_data_filepath, "wb") as f:
-                    pickle.dump(labeled_data, f)
-                roc_curves_filepath = os.path.join(
-                    file_dir, SAVED_FILE_NAMES["roc curves"]
-                )
-                with open(roc_curves_filepath, "wb") as f:
-                    pickle.dump(roc_curves, f)
-                fitted_params_filepath = os.path.join(
-                    file_dir, SAVED_FILE_NAMES["parameter fitting"]
-                )
-                with open(fitted_params_filepath, "wb") as f:
-                    pickle.dump(fitted_params, f)
-
-                raw_grid_filepath = os.path.join(file_dir, SAVED_FILE_NAMES["raw data"])
-                df.to_feather(raw_grid_filepath)
-
-                new_labeled_data[filename] = labeled_data
-                new_roc_curves[filename] = roc_curves
+                # one request processes an upload at a time, the others wait
+                # for its result instead of redoing the work
+                with storage.file_lock(filename + ".processing"):
+                    upload_path = storage.upload_path(filename)
+                    if os.path.exists(upload_path):
+                        # moved out of the way, so an upload arriving now is
+                        # staged for the next request
+                        build_dir = storage.new_build_dir()
+                        raw_file_path = os.path.join(build_dir, filename)
+                        os.replace(upload_path, raw_file_path)
+                        source_hash = storage.file_hash(raw_file_path)
+                        if source_hash == storage.published_hash(filename):
+                            shutil.rmtree(build_dir)
+                            build_dir = None
+
+                    if build_dir is None:
+                        # unchanged, or processed by another request meanwhile
+                        labeled_data, fitted_params, df = read_processed_files(
+                            filename
+                        )
+                    else:
+                        profiler = instrumentation.StageProfiler(PROFILE_MEMORY)
+                        with profiler, profiler.stage("total"):
+                            with profiler.stage("read file"):
+                                df = ingest.read_table(raw_file_path, filename)
+
+                            with profiler.stage("label data"):
+                                labeled_data = utils.label_data(df)
+                            with profiler.stage("make roc curves"):
+                                roc_curves = utils.make_roc_curve(labeled_data)
+                            with profiler.stage("fit parameters"):
+                                # the fits run in worker processes, which
+                                # measure them and send the numbers back
+                                fit_profile = {}
+                                fitted_params = utils.fit_params(
+                                    labeled_data,
+                                    profile=fit_profile,
+                                    trace_memory=PROFILE_MEMORY,
+                                )
+                                for column, stats in fit_profile.items():
+                                    profiler.record(
+                                        "fit parameters", column=column, **stats
+                                    )
+
+                            with profiler.stage("write labeled data"):
+                                labeled_data_filepath = os.path.join(
+                                    build_dir, SAVED_FILE_NAMES["labeled data"]
+                                )
+                                with open(labeled_data_filepath, "wb") as f:
+                                    pickle.dump(labeled_data, f)
+                            with profiler.stage("write roc curves"):
+                                roc_curves_filepath = os.path.join(
+                                    build_dir, SAVED_FILE_NAMES["roc curves"]
+                                )
+                                with open(roc_curves_filepath, "wb") as f:
+                                    pickle.dump(roc_curves, f)
+                            with profiler.stage("write fitted parameters"):
+                                fitted_params_filepath = os.path.join(
+                                    build_dir, SAVED_FILE_NAMES["parameter fitting"]
+                                )
+                                with open(fitted_params_filepath, "wb") as f:
+                                    pickle.dump(fitted_params, f)
+                            with profiler.stage("write raw data"):
+                                raw_grid_filepath = os.path.join(
+                                    build_dir, SAVED_FILE_NAMES["raw data"]
+                                )
+                                df.to_feather(raw_grid_filepath)
+
+                        profile_filepath = os.path.join(
+                            build_dir, OPTIONAL_FILE_NAMES["processing profile"]
+                        )
+                        with open(profile_filepath, "w") as f:
+                            json.dump(
+                                {
+                                    "filename": filename,
+                                    "rows": len(df),
+                                    "columns": len(labeled_data),
+                                    "traced_memory": PROFILE_MEMORY,
+                                    "stages": profiler.stages,
+                                },
+                                f,
+                                indent=2,
+                            )
+
+                        storage.write_hash(build_dir, source_hash)
+                        storage.publish(build_dir, filename)
+                        build_dir = None
+
+                new_column_ranges[filename] = column_ranges(labeled_data)
                 new_fit_params[filename] = fitted_params
                 new_raw_data_for_grid[filename] = df.to_dict("records")
 
@@ -308,11 +367,9 @@ def data_processing(uploaded_files_list, processed_files_list):
 
             except Exception as e:
                 errors.append(f"Error processing file {filename}: {e}")
-                if os.path.exists(filename):
-                    try:
-                        shutil.rmtree(filename)
-                    except OSError as e:
-                        errors.append(f"Error: {filename} - {e.strerror}.")
+                # nothing was published, the previous version stays in place
+                if build_dir is not None:
+                    shutil.rmtree(build_dir, ignore_errors=True)
 
     # Logic for alerts
     fail_is_open = len(errors) > 0
@@ -322,8 +379,7 @@ def data_processing(uploaded_files_list, processed_files_list):
     if last_processed_file:
         return (
             finished_processed_files_list,
-            new_labeled_data.get(last_processed_file, {}),
-            new_roc_curves.get(last_processed_file, {}),
+            new_column_ranges.get(last_processed_file, {}),
             new_fit_params.get(last_processed_file, {}),
             new_raw_data_for_grid.get(last_processed_file, {}),
             fail_is_open,
@@ -335,47 +391,331 @@ def data_processing(uploaded_files_list, processed_files_list):
         no_update,
         no_update,
         no_update,
-        no_update,
         fail_is_open,
         fail_children,
     )
 
 
+@callback(
+    Output("processed-files-list", "data", allow_duplicate=True),
+    Output("column-ranges", "data", allow_duplicate=True),
+    Output("fit-params", "data", allow_duplicate=True),
+    Output("raw-data-for-grid", "data", allow_duplicate=True),
+    Output("alert-fail", "is_open", allow_duplicate=True),
+    Output("alert-fail", "children", allow_duplicate=True),
+    Input("append-data", "contents"),
+    State("append-data", "filename"),
+    State("append-target", "value"),
+    State("append-refit", "value"),
+    State("processed-files-list", "data"),
+    prevent_initial_call=True,
+)
+@instrumentation.instrument
+def append_data(content, batch_name, filename, refit, processed_files_list):
+    # merge the rows of a batch into a processed file instead of processing
+    # the whole file again
+    if not content or not filename:
+        raise dash.exceptions.PreventUpdate
+
+    try:
+        # the name comes from the browser, it is only shown and kept next to
+        # the checksum of the batch
+        if (
+            os.path.basename(batch_name) != batch_name
+            or batch_name.startswith(".")
+            or "\\" in batch_name
+            or not batch_name.isprintable()
+        ):
+            raise ValueError("the batch name must be a plain file name")
+        decoded = base64.b64decode(content.split(",")[1])
+        if ingest.file_format(batch_name) is None:
+            raise ValueError(
+                f"The filetype of {batch_name} is incorrect. Please upload a {ingest.supported_extensions()} file."
+            )
+        df = ingest.read_table(decoded, batch_name)
+        if "reference_result" in df.columns and (
+            not df["reference_result"].isin({float(-1), float(0), float(1), np.nan}).all()
+        ):
+            raise ValueError(
+                f"The column 'reference_result' in file {batch_name} has incorrect values, must be -1, 0, 1, or be empty."
+            )
+        labeled_data, fitted_params, _ = append_to_processed_file(
+            filename, batch_name, decoded, df, refit
+        )
+        with storage.file_lock(filename, shared=True):
+            raw_data_df = datastore.read_raw_data(filename)
+    except pd.errors.EmptyDataError:
+        return (no_update,) * 4 + (True, f"Error: The file {batch_name} is empty.")
+    except Exception as e:
+        return (no_update,) * 4 + (
+            True,
+            f"Error appending {batch_name} to {filename}: {e}",
+        )
+
+    # the file is selected again, so the analysis page shows the new rows
+    processed_files_list = [f for f in processed_files_list or [] if f != filename]
+    processed_files_list.append(filename)
+    return (
+        processed_files_list,
+        column_ranges(labeled_data),
+        fitted_params,
+        raw_data_df.to_dict("records"),
+        False,
+        "",
+    )
+
+
+def update_processed_file(filename, update):
+    # publish a new version of a processed file with some of its rows changed.
+    # update(build_dir, labeled_data, fitted_params) writes the changed raw data
+    # into build_dir and returns the new (labeled_data, fitted_params,
+    # roc_curves) and a hash of the change. The other files are linked from
+    # the published version, not rewritten.
+    with storage.file_lock(filename + ".processing"):
+        build_dir = storage.new_build_dir()
+        try:
+            with storage.file_lock(filename, shared=True):
+                with open(
+                    storage.dataset_path(filename, SAVED_FILE_NAMES["labeled data"]),
+                    "rb",
+                ) as f:
+                    labeled_data = pickle.load(f)
+                with open(
+                    storage.dataset_path(
+                        filename, SAVED_FILE_NAMES["parameter fitting"]
+                    ),
+                    "rb",
+                ) as f:
+                    fitted_params = pickle.load(f)
+                storage.link_dataset(
+                    filename,
+                    build_dir,
+                    skip={
+                        SAVED_FILE_NAMES["labeled data"],
+                        SAVED_FILE_NAMES["roc curves"],
+                        SAVED_FILE_NAMES["parameter fitting"],
+                        OPTIONAL_FILE_NAMES["roc report"],
+                        # the profile is of the upload, the report files of a
+                        # job on the published version
+                        OPTIONAL_FILE_NAMES["processing profile"],
+                        reports.PARTIAL_FILE_NAME,
+                        reports.ERROR_FILE_NAME,
+                        storage.SOURCE_HASH_FILE,
+                    },
+                )
+                old_hash = storage.published_hash(filename) or ""
+
+            (labeled_data, fitted_params, roc_curves), change_hash = update(
+                build_dir, labeled_data, fitted_params
+            )
+
+            for name, value in [
+                ("labeled data", labeled_data),
+                ("roc curves", roc_curves),
+                ("parameter fitting", fitted_params),
+            ]:
+                with open(os.path.join(build_dir, SAVED_FILE_NAMES[name]), "wb") as f:
+                    pickle.dump(value, f)
+
+            # no longer the hash of a single upload, uploading the original
+            # file again processes it from scratch
+            storage.write_hash(
+                build_dir, hashlib.sha1((old_hash + change_hash).encode()).hexdigest()
+            )
+            storage.publish(build_dir, filename)
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+    return labeled_data, fitted_params, roc_curves
+
+
+def append_to_processed_file(filename, batch_name, content, df, refit=False):
+    # the batch is saved as the next segment of the raw data and merged into
+    # the class arrays and roc curves, the fitted parameters are kept unless
+    # refit
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    def update(build_dir, labeled_data, fitted_params):
+        raw_paths = storage.raw_data_paths(filename, build_dir)
+        schema = feather.read_table(raw_paths[0], memory_map=True).schema
+        if set(df.columns) != set(schema.names):
+            raise ValueError(
+                "the columns of the batch differ from those of the file, "
+                "upload the whole file instead"
+            )
+        batch = df[schema.names]
+        # labeling fills in missing reference results, so the segment has
+        # them filled like the raw data of the upload
+        new_labeled_data = utils.append_labeled_data(labeled_data, batch)
+        table = pa.Table.from_pandas(batch, schema=schema, preserve_index=False)
+
+        segment = len(raw_paths)
+        append_dir = os.path.join(build_dir, storage.APPEND_FOLDER)
+        os.makedirs(append_dir, exist_ok=True)
+        feather.write_feather(table, os.path.join(append_dir, f"{segment}.feather"))
+        # only the checksum of the uploaded batch is kept, in sha1sum format
+        batch_hash = hashlib.sha1(content).hexdigest()
+        with open(os.path.join(append_dir, f"{segment}.sha1"), "w") as f:
+            f.write(f"{batch_hash}  {batch_name}\n")
+
+        roc_curves = {
+            column: utils.roc_curve_from_sorted(data)
+            for column, data in new_labeled_data.items()
+        }
+        if refit:
+            fitted_params = utils.fit_params(new_labeled_data)
+        return (new_labeled_data, fitted_params, roc_curves), batch_hash
+
+    return update_processed_file(filename, update)
+
+
+def relabel_processed_file(filename, relabels):
+    # relabels is [(row, reference_result)], rows counted over the raw data of
+    # the upload and the appended batches. The edits are applied as one batch:
+    # every column moves the samples of the rows to their new classes without
+    # reprocessing the file, and only the changed reference results are
+    # written next to the raw data (see storage.RELABEL_FILE). The fitted
+    # parameters are kept.
+    import pyarrow.feather as feather
+
+    def update(build_dir, labeled_data, fitted_params):
+        with storage.file_lock(filename, shared=True):
+            with open(
+                storage.dataset_path(filename, SAVED_FILE_NAMES["roc curves"]), "rb"
+            ) as f:
+                roc_curves = pickle.load(f)
+
+        # first row of every raw data segment
+        paths = storage.raw_data_paths(filename, build_dir)
+        tables = [feather.read_table(path, memory_map=True) for path in paths]
+        starts = np.cumsum([0] + [table.num_rows for table in tables])
+        if "reference_result" not in tables[0].schema.names:
+            raise ValueError("the file has no reference_result column")
+
+        # the last edit of a row counts
+        final = {}
+        for row, reference_result in relabels:
+            if not 0 <= row < starts[-1]:
+                raise ValueError(f"no row {row}")
+            final[int(row)] = float(reference_result)
+
+        changed = storage.read_relabels(filename, build_dir)
+        moves = []
+        for row, reference_result in final.items():
+            segment = int(np.searchsorted(starts, row, side="right")) - 1
+            values = tables[segment].slice(row - starts[segment], 1).to_pylist()[0]
+            old_label = utils.reference_label(
+                changed.get(row, values["reference_result"])
+            )
+            moves.append((values, old_label, utils.reference_label(reference_result)))
+            changed[row] = reference_result
+
+        for column, column_data in labeled_data.items():
+            utils.relabel_samples(
+                column_data,
+                roc_curves[column],
+                [(float(values[column]), old, new) for values, old, new in moves],
+            )
+        storage.write_relabels(build_dir, changed)
+
+        change = json.dumps([[int(row), float(value)] for row, value in relabels])
+        return (
+            (labeled_data, fitted_params, roc_curves),
+            hashlib.sha1(change.encode()).hexdigest(),
+        )
+
+    return update_processed_file(filename, update)
+
+
+@app.callback(
+    Output("column-ranges", "data", allow_duplicate=True),
+    Output("alert-fail", "is_open", allow_duplicate=True),
+    Output("alert-fail", "children", allow_duplicate=True),
+    Input("ag-grid", "cellValueChanged"),
+    State("file-select", "value"),
+    prevent_initial_call=True,
+)
+@instrumentation.instrument
+def relabel_rows(changes, selected_file):
+    # reference results edited in the file viewer, rowId is the position of
+    # the row in the raw data
+    if isinstance(changes, dict):
+        changes = [changes]
+    changes = [
+        change
+        for change in changes or []
+        if change.get("colId") == "reference_result"
+        and change.get("value") != change.get("oldValue")
+    ]
+    if not changes or not selected_file:
+        raise dash.exceptions.PreventUpdate
+
+    try:
+        relabels = []
+        for change in changes:
+            value = change.get("value")
+            value = 0.0 if value in (None, "") else float(value)
+            if value not in (-1, 0, 1):
+                raise ValueError("reference_result must be -1, 0 or 1")
+            relabels.append((int(change["rowId"]), value))
+        labeled_data, _, _ = relabel_processed_file(selected_file, relabels)
+    except Exception as e:
+        return (
+            no_update,
+            True,
+            f"Error changing reference_result of {selected_file}: {e}",
+        )
+    # sent again even if unchanged, so the plots are redrawn from the new file
+    return column_ranges(labeled_data), False, ""
+
+
 @app.callback(
-    Output("labeled-data", "data"),
+    Output("column-ranges", "data"),
     Output("fit-params", "data"),
-    Output("roc-curves", "data"),
     Output("raw-data-for-grid", "data"),
     Input("file-select", "value"),
     prevent_initial_call=True,
 )
+@instrumentation.instrument
 def load_data_into_stores(file_select_value):
     if file_select_value is None:
-        return no_update, no_update, no_update, no_update
+        return no_update, no_update, no_update
 
-    file_dir = os.path.join("data", file_select_value)
+    labeled_data, fit_params, raw_data_df = read_processed_files(file_select_value)
+    raw_data_for_grid = raw_data_df.to_dict("records")
 
-    # Load labeled data from pickle
-    labeled_data_path = os.path.join(file_dir, "labeled_data.pkl")
-    with open(labeled_data_path, "rb") as f:
-        labeled_data = pickle.load(f)
+    return column_ranges(labeled_data), fit_params, raw_data_for_grid
 
-    # Load fitted params from pickle
-    fit_params_path = os.path.join(file_dir, "fitted_params.pkl")
-    with open(fit_params_path, "rb") as f:
-        fit_params = pickle.load(f)
 
-    # Load ROC curve data from pickle
-    roc_curves_path = os.path.join(file_dir, "roc_curves.pkl")
-    with open(roc_curves_path, "rb") as f:
-        roc_curves = pickle.load(f)
+def column_ranges(labeled_data):
+    # all the browser keeps of the labeled data, the plots read the classes
+    # from datastore.load_dataset
+    return {
+        column: {"range_min": data["range_min"], "range_max": data["range_max"]}
+        for column, data in labeled_data.items()
+    }
 
-    # Load raw data from feather and convert to dict for AG Grid
-    raw_data_path = os.path.join(file_dir, "raw_data.feather")
-    raw_data_df = pd.read_feather(raw_data_path)
-    raw_data_for_grid = raw_data_df.to_dict("records")
 
-    return labeled_data, fit_params, roc_curves, raw_data_for_grid
+def read_processed_files(filename):
+    file_dir = os.path.join(DATA_FOLDER, filename)
+
+    # a shared lock, so the files all come from the same processing run
+    with storage.file_lock(filename, shared=True):
+        # Load labeled data from pickle
+        labeled_data_path = os.path.join(file_dir, SAVED_FILE_NAMES["labeled data"])
+        with open(labeled_data_path, "rb") as f:
+            labeled_data = pickle.load(f)
+
+        # Load fitted params from pickle
+        fit_params_path = os.path.join(file_dir, SAVED_FILE_NAMES["parameter fitting"])
+        with open(fit_params_path, "rb") as f:
+            fit_params = pickle.load(f)
+
+        # Load raw data from feather, with the rows of appended batches
+        raw_data_df = datastore.read_raw_data(filename)
+
+    return labeled_data, fit_params, raw_data_df
 
 
 # Sliders #
@@ -389,15 +729,15 @@ def load_data_into_stores(file_select_value):
     Input("column-select", "value"),
     Input("range-reset", "n_clicks"),
     State("range-slider", "value"),
-    State("labeled-data", "data"),
+    State("column-ranges", "data"),
     prevent_initial_call=False,
 )
-def reset_range_slider(selected_column, n_clicks, rangeslider_value, labeled_data):
+def reset_range_slider(selected_column, n_clicks, rangeslider_value, ranges):
     if not selected_column:
         raise dash.exceptions.PreventUpdate
 
-    range_min = labeled_data.get(selected_column, {}).get("range_min", 0)
-    range_max = labeled_data.get(selected_column, {}).get("range_max", 0)
+    range_min = ranges.get(selected_column, {}).get("range_min", 0)
+    range_max = ranges.get(selected_column, {}).get("range_max", 0)
 
     rangeslider_value = [range_min, range_max]
 
@@ -433,43 +773,173 @@ def update_threshold_slider(rangeslider_value, slider_value):
 # roc figures #
 
 
-no_fig = go.Figure()
-no_fig.add_annotation(
-    text="No Data",
-    xref="paper",
-    yref="paper",
-    x=0.5,
-    y=0.5,
-    showarrow=False,
-    font=dict(size=24, color="grey"),
-)
-no_fig.update_layout(xaxis={"visible": False}, yaxis={"visible": False})
+roc_inputs = [
+    Input("column-select", "value"),
+    Input("slider-position", "value"),
+    Input("pos-statfit-select", "value"),
+    Input("neg-statfit-select", "value"),
+    Input("bootstrap-ci", "value"),
+    Input("ag-grid", "filterModel"),
+]
+coalesce.sequence_callback(app, "roc-request-seq", *roc_inputs)
 
 
 @app.callback(
     Output("roc_plot", "figure"),
     Output("roc-table", "data"),
     Output("roc-table", "columns"),
-    Input("column-select", "value"),
-    Input("slider-position", "value"),
+    Input("roc-request-seq", "data"),
+    *roc_inputs,
     State("fit-params", "data"),
-    State("roc-curves", "data"),
+    State("file-select", "value"),
+    State("session-id", "data"),
     prevent_inital_call=False,
 )
-def update_roc_plot_and_table(selected_column, pos_x, fitted_params, roc_curves):
-    if not roc_curves or not selected_column:
-        return no_fig, None, None
-
-    roc_column = roc_curves.get(selected_column)
+@instrumentation.instrument
+@coalesce.latest_only
+def update_roc_plot_and_table(
+    request_seq,
+    selected_column,
+    pos_x,
+    pos_fit_dist,
+    neg_fit_dist,
+    bootstrap_ci,
+    filter_model,
+    fitted_params,
+    selected_file,
+    session_id,
+):
+    if not selected_file or not selected_column or not fitted_params:
+        return utils.no_data_figure(), None, None
+
+    # the curve of the whole column, built once per dataset on the server
+    dataset, _ = datastore.load_dataset(selected_file)
+    if selected_column not in dataset:
+        return utils.no_data_figure(), None, None
+    roc_column = datastore.load_roc_curve(selected_file, selected_column)
+
+    # rows left by the filters of the data grid, recomputed from the raw data
+    subset, filter_error = None, None
+    if filter_model:
+        try:
+            subset = datastore.load_filtered_roc(
+                selected_file, selected_column, filter_model
+            )
+        except ValueError as e:
+            filter_error = str(e)
+        else:
+            # the list based curve of the subset, only for the column on screen
+            roc_column = None
+            if subset["data"] is not None:
+                roc_column = utils.roc_curve_from_sorted(subset["data"])
 
     # Check if roc_column and its population_data are available and not empty
     if not roc_column or not roc_column.get("population_data"):
-        return no_fig, None, None
+        return utils.no_data_figure(), None, None
     else:
         ROCDataTable_data, ROCDataTable_columns, roc_index = utils.gen_roc_table(
             roc_column, pos_x, fitted_params[selected_column]["positive"]["norm"]
         )
         roc_fig, df_roc, mirrored = utils.plot_roc_curve(roc_column, roc_index, False)
+
+        # smooth ROC of the selected stat. fits next to the empirical one
+        model_roc = None
+        if pos_fit_dist and neg_fit_dist:
+            model_roc = utils.model_roc_curve(
+                pos_fit_dist,
+                fitted_params[selected_column]["positive"][pos_fit_dist],
+                neg_fit_dist,
+                fitted_params[selected_column]["negative"][neg_fit_dist],
+                dataset[selected_column]["range_min"],
+                dataset[selected_column]["range_max"],
+                mirrored,
+            )
+        if model_roc is not None:
+            model_tnr, model_tpr, model_thresholds, model_auc = model_roc
+            roc_fig.add_trace(
+                go.Scatter(
+                    x=model_tnr,
+                    y=model_tpr,
+                    mode="lines",
+                    line=dict(color="grey", dash="dot"),
+                    name="Model ROC",
+                    customdata=model_thresholds,
+                    hovertemplate="Model ROC<br>"
+                    + "Threshold: <b>%{customdata:.2f}</b><br>"
+                    + "Sensitivity (TPR): %{y:.2f}<br>"
+                    + "Specificity (1-FPR): %{x:.2f}<extra></extra>",
+                )
+            )
+
+        # resampled once per column, the slider only looks the intervals up
+        intervals = None
+        # intervals are of the whole file, they are left out for a subset
+        if bootstrap_ci and subset is None:
+            intervals = datastore.load_bootstrap(selected_file, selected_column)
+        if intervals is not None:
+            band_lower, band_upper = intervals["band_sensitivity"]
+            roc_fig.add_trace(
+                go.Scatter(
+                    x=intervals["band_specificity"],
+                    y=band_upper,
+                    mode="lines",
+                    line=dict(width=0),
+                    hoverinfo="skip",
+                )
+            )
+            roc_fig.add_trace(
+                go.Scatter(
+                    x=intervals["band_specificity"],
+                    y=band_lower,
+                    mode="lines",
+                    line=dict(width=0),
+                    fill="tonexty",
+                    fillcolor="rgba(128, 128, 128, 0.25)",
+                    hoverinfo="skip",
+                )
+            )
+            ci_row = {column["id"]: "" for column in ROCDataTable_columns}
+            ci_row[ROCDataTable_columns[0]["id"]] = f"{intervals['confidence']:.0%} CI"
+            for name, metric in [
+                ("Sensitivity (TPR)", "sensitivity"),
+                ("Specificity (TNR)", "specificity"),
+                ("PPV", "ppv"),
+            ]:
+                lower, upper = bootstrap.interval_at(intervals, metric, pos_x)
+                ci_row[name] = f"{lower:.2f}–{upper:.2f}"
+            ROCDataTable_data.append(ci_row)
+
+        auc_lines = []
+        if filter_error:
+            auc_lines.append(f"Grid filter not applied: {filter_error}")
+        if subset is not None:
+            auc = subset["auc"]
+            auc_lines.append(f"Filtered: {subset['rows']} rows")
+            auc_lines.append(f"AUC: {auc:.3f}" if auc is not None else "AUC: n/a")
+        elif model_roc is not None or intervals is not None:
+            curves = datastore.load_decimated_curves(selected_file, [selected_column])
+            if selected_column in curves:
+                auc_text = f"AUC: {curves[selected_column]['auc']:.3f}"
+                if intervals is not None:
+                    lower, upper = intervals["auc"]
+                    auc_text += (
+                        f" ({intervals['confidence']:.0%} CI {lower:.3f}–{upper:.3f})"
+                    )
+                auc_lines.append(auc_text)
+        if model_roc is not None:
+            auc_lines.append(f"Model AUC: {model_auc:.3f}")
+        if auc_lines:
+            roc_fig.add_annotation(
+                text="<br>".join(auc_lines),
+                xref="paper",
+                yref="paper",
+                x=0.98,
+                y=0.02,
+                xanchor="right",
+                yanchor="bottom",
+                align="right",
+                showarrow=False,
+            )
         roc_fig.update_layout(
             showlegend=False,
             xaxis=dict(range=[1.05, -0.05], title="Specificty (TNR)"),
@@ -494,6 +964,107 @@ def set_threshold_on_click_rocplot(clickData):
     return no_update
 
 
+@app.callback(
+    Output("compare-columns-select", "options"),
+    Output("compare-columns-select", "value"),
+    Input("column-select", "options"),
+    State("compare-columns-select", "value"),
+    prevent_initial_call=True,
+)
+def update_compare_dropdown(column_options, selected_columns):
+    if not column_options:
+        return [], []
+    columns = {option["value"] for option in column_options}
+    # keep the selection if the new file has the same columns
+    selected_columns = [c for c in selected_columns or [] if c in columns]
+    return column_options, selected_columns
+
+
+@app.callback(
+    Output("compare-roc-plot", "figure"),
+    Input("compare-columns-select", "value"),
+    State("file-select", "value"),
+)
+@instrumentation.instrument
+def update_compare_roc_plot(selected_columns, selected_file):
+    if not selected_columns or not selected_file:
+        return utils.no_data_figure()
+
+    curves = datastore.load_decimated_curves(selected_file, selected_columns)
+    if not curves:
+        return utils.no_data_figure()
+
+    # all traces are built first and handed to the figure in one go
+    traces = [
+        go.Scatter(
+            x=[1, 0],
+            y=[0, 1],
+            mode="lines",
+            line=dict(color="lightgrey", dash="dash"),
+            hoverinfo="skip",
+            showlegend=False,
+        )
+    ]
+    for column, curve in sorted(curves.items(), key=lambda kv: -kv[1]["auc"]):
+        traces.append(
+            go.Scatter(
+                x=curve["tnr"],
+                y=curve["tpr"],
+                mode="lines",
+                name=f"{column} (AUC {curve['auc']:.3f})",
+                customdata=curve["thresholds"],
+                hovertemplate=f"<b>{column}</b><br>"
+                + "Threshold: <b>%{customdata:.2f}</b><br>"
+                + "Sensitivity (TPR): %{y:.2f}<br>"
+                + "Specificity (1-FPR): %{x:.2f}<extra></extra>",
+            )
+        )
+
+    fig = go.Figure(data=traces)
+    fig.update_layout(
+        xaxis=dict(range=[1.05, -0.05], title="Specificty (TNR)"),
+        yaxis=dict(range=[-0.05, 1.05], title="Sensitivity (TPR)"),
+        legend=dict(x=0.98, y=0.02, xanchor="right", yanchor="bottom"),
+        dragmode=False,
+    )
+    return fig
+
+
+@app.callback(
+    Output("compare-delong-table", "data"),
+    Output("compare-delong-table", "columns"),
+    Input("compare-columns-select", "value"),
+    State("file-select", "value"),
+)
+@instrumentation.instrument
+def update_compare_delong_table(selected_columns, selected_file):
+    # paired DeLong test of every pair of the selected columns
+    if not selected_columns or len(selected_columns) < 2 or not selected_file:
+        return [], []
+
+    comparison = datastore.load_delong(selected_file, selected_columns)
+    if comparison is None:
+        return [], []
+
+    cases = f"{comparison['positives']} pos. / {comparison['negatives']} neg."
+    data = [
+        {
+            "Columns": f"{pair['a']} vs. {pair['b']}",
+            "AUC": f"{comparison['aucs'][pair['a']]:.3f} vs. "
+            + f"{comparison['aucs'][pair['b']]:.3f}",
+            "Difference": round(pair["difference"], 4),
+            "Covariance": f"{pair['covariance']:.2e}",
+            "SE": round(pair["se"], 4),
+            "z": f"{pair['z']:.2f}",
+            "p-value": f"{pair['p']:.3g}",
+            "Complete Cases": cases,
+        }
+        for pair in comparison["pairs"]
+    ]
+    columns = [{"name": name, "id": name} for name in data[0]]
+    return data, columns
+
+
 # data ag grid #
 
 
@@ -514,6 +1085,13 @@ def update_data_grid(raw_data_for_grid, selected_file):
         row_Data = raw_data_for_grid
         column_names = list(raw_data_for_grid[0].keys())
         column_Defs = [{"field": i} for i in column_names]
+        for column_def in column_Defs:
+            # changed reference results update the roc curves, see
+            # relabel_rows
+            if column_def["field"] == "reference_result":
+                column_def["editable"] = True
+                column_def["cellEditor"] = "agSelectCellEditor"
+                column_def["cellEditorParams"] = {"values": [-1, 0, 1]}
 
         return row_Data, column_Defs
     return [], []  # Return empty lists if no data or file selected
@@ -526,19 +1104,22 @@ def update_data_grid(raw_data_for_grid, selected_file):
     Output("pos-btn-1", "outline"),
     Output("pos-btn-2", "outline"),
     Output("pos-btn-3", "outline"),
+    Output("pos-btn-4", "outline"),
     Input("pos-btn-1", "n_clicks"),
     Input("pos-btn-2", "n_clicks"),
     Input("pos-btn-3", "n_clicks"),
+    Input("pos-btn-4", "n_clicks"),
     State("pos-btn-1", "outline"),
     State("pos-btn-2", "outline"),
     State("pos-btn-3", "outline"),
+    State("pos-btn-4", "outline"),
 )
-def update_positive_buttons(b1, b2, b3, o1, o2, o3):
+def update_positive_buttons(b1, b2, b3, b4, o1, o2, o3, o4):
     button_id = ctx.triggered_id
     if not button_id:
-        return no_update, no_update, no_update
+        return no_update, no_update, no_update, no_update
 
-    new_o1, new_o2, new_o3 = o1, o2, o3
+    new_o1, new_o2, new_o3, new_o4 = o1, o2, o3, o4
 
     if "pos-btn-1" == button_id:
         new_o1 = not o1
@@ -546,70 +1127,84 @@ def update_positive_buttons(b1, b2, b3, o1, o2, o3):
         new_o2 = not o2
     elif "pos-btn-3" == button_id:
         new_o3 = not o3
+    elif "pos-btn-4" == button_id:
+        new_o4 = not o4
 
-    return new_o1, new_o2, new_o3
+    return new_o1, new_o2, new_o3, new_o4
 
 
 @app.callback(
     Output("neg-btn-1", "outline"),
     Output("neg-btn-2", "outline"),
     Output("neg-btn-3", "outline"),
+    Output("neg-btn-4", "outline"),
     Input("neg-btn-1", "n_clicks"),
     Input("neg-btn-2", "n_clicks"),
     Input("neg-btn-3", "n_clicks"),
+    Input("neg-btn-4", "n_clicks"),
     State("neg-btn-1", "outline"),
     State("neg-btn-2", "outline"),
     State("neg-btn-3", "outline"),
+    State("neg-btn-4", "outline"),
 )
-def update_negative_buttons(b1, b2, b3, o1, o2, o3):
+def update_negative_buttons(b1, b2, b3, b4, o1, o2, o3, o4):
     button_id = ctx.triggered_id
     if not button_id:
-        return no_update, no_update, no_update
+        return no_update, no_update, no_update, no_update
 
-    new_o1, new_o2, new_o3 = o1, o2, o3
+    new_o1, new_o2, new_o3, new_o4 = o1, o2, o3, o4
 
     if "neg-btn-1" == button_id:
         new_o1 = not o1
-        return new_o1, o2, o3
+        return new_o1, o2, o3, o4
     elif "neg-btn-2" == button_id:
         new_o2 = not o2
-        return o1, new_o2, o3
+        return o1, new_o2, o3, o4
     elif "neg-btn-3" == button_id:
         new_o3 = not o3
-        return o1, o2, new_o3
+        return o1, o2, new_o3, o4
+    elif "neg-btn-4" == button_id:
+        new_o4 = not o4
+        return o1, o2, o3, new_o4
 
-    return new_o1, new_o2, new_o3
+    return new_o1, new_o2, new_o3, new_o4
 
 
 @app.callback(
     Output("unk-btn-1", "outline"),
     Output("unk-btn-2", "outline"),
     Output("unk-btn-3", "outline"),
+    Output("unk-btn-4", "outline"),
     Input("unk-btn-1", "n_clicks"),
     Input("unk-btn-2", "n_clicks"),
     Input("unk-btn-3", "n_clicks"),
+    Input("unk-btn-4", "n_clicks"),
     State("unk-btn-1", "outline"),
     State("unk-btn-2", "outline"),
     State("unk-btn-3", "outline"),
+    State("unk-btn-4", "outline"),
 )
-def update_unknown_buttons(b1, b2, b3, o1, o2, o3):
+def update_unknown_buttons(b1, b2, b3, b4, o1, o2, o3, o4):
     button_id = ctx.triggered_id
     if not button_id:
-        return no_update, no_update, no_update
+        return no_update, no_update, no_update, no_update
 
-    new_o1, new_o2, new_o3 = o1, o2, o3
+    new_o1, new_o2, new_o3, new_o4 = o1, o2, o3, o4
 
     if "unk-btn-1" == button_id:
         new_o1 = not o1
-        return new_o1, o2, o3
+        return new_o1, o2, o3, o4
     elif "unk-btn-2" == button_id:
         new_o2 = not o2
-        return o1, new_o2, o3
+        return o1, new_o2, o3, o4
     elif "unk-btn-3" == button_id:
         new_o3 = not o3
-        return o1, o2, new_o3
+        return o1, o2, new_o3, o4
+    elif "unk-btn-4" == button_id:
+        new_o4 = not o4
+        return o1, o2, o3, new_o4
 
-    return new_o1, new_o2, new_o3
+    return new_o1, new_o2, new_o3, new_o4
 
 
 # dropdowns #
@@ -636,20 +1231,24 @@ def update_file_dropdown(processed_files_list):  # , current_page):
 @app.callback(
     Output("column-select", "options"),
     Output("column-select", "value"),
-    Input("labeled-data", "data"),
+    Input("column-ranges", "data"),
+    State("column-select", "value"),
     prevent_initial_call=True,
 )
-def update_column_dropdown(labeled_data):
-    if not labeled_data:
+def update_column_dropdown(ranges, selected_column):
+    if not ranges:
         return [], None
 
-    column_names = list(labeled_data.keys())
+    column_names = list(ranges.keys())
     # try:
     #     column_names.remove("reference_result")
     # except ValueError:
     #     pass
     options = [{"label": column, "value": column} for column in column_names]
     default_value = column_names[0] if column_names else None
+    # relabeled or appended rows keep the column on screen
+    if selected_column in column_names:
+        default_value = selected_column
 
     return options, default_value
 
@@ -658,19 +1257,47 @@ def update_column_dropdown(labeled_data):
     Output("pos-statfit-select", "value"),
     Output("neg-statfit-select", "value"),
     Output("unknown-statfit-select", "value"),
+    Output("pos-statfit-select", "options"),
+    Output("neg-statfit-select", "options"),
+    Output("unknown-statfit-select", "options"),
     Input("column-select", "value"),
+    State("fit-params", "data"),
     State("pos-statfit-select", "value"),
     State("neg-statfit-select", "value"),
     State("unknown-statfit-select", "value"),
 )
-def init_statfit_select(selected_column, pos, neg, unk):
-    if not pos:
-        pos = "gompertz"
-    if not neg:
-        neg = "gompertz"
-    if not unk:
-        unk = "gompertz"
-    return pos, neg, unk
+def init_statfit_select(selected_column, fitted_params, pos, neg, unk):
+    best_fit = {}
+    goodness_of_fit = {}
+    if fitted_params and selected_column in fitted_params:
+        # older processed files have no scores
+        best_fit = fitted_params[selected_column].get("best_fit", {})
+        goodness_of_fit = fitted_params[selected_column].get("goodness_of_fit", {})
+
+    pos = best_fit.get("positive") or pos or "gompertz"
+    neg = best_fit.get("negative") or neg or "gompertz"
+    unk = best_fit.get("unknown") or unk or "gompertz"
+
+    def options(label):
+        scores = goodness_of_fit.get(label) or {}
+        out = []
+        for dist_name, dist_label in STATFIT_LABELS.items():
+            aic = (scores.get(dist_name) or {}).get("aic")
+            if aic is not None and np.isfinite(aic):
+                dist_label += f" (AIC {aic:.1f})"
+            if dist_name == best_fit.get(label):
+                dist_label += " \u2605"
+            out.append({"label": dist_label, "value": dist_name})
+        return out
+
+    return (
+        pos,
+        neg,
+        unk,
+        options("positive"),
+        options("negative"),
+        options("unknown"),
+    )
 
 
 # main graph #
@@ -692,58 +1319,88 @@ def set_threshold_on_click_maingraph(clickData, range_value):
     return no_update
 
 
+graph_inputs = [
+    Input("pos-statfit-select", "value"),
+    Input("neg-statfit-select", "value"),
+    Input("unknown-statfit-select", "value"),
+    Input("pos-btn-1", "outline"),
+    Input("pos-btn-2", "outline"),
+    Input("pos-btn-3", "outline"),
+    Input("pos-btn-4", "outline"),
+    Input("neg-btn-1", "outline"),
+    Input("neg-btn-2", "outline"),
+    Input("neg-btn-3", "outline"),
+    Input("neg-btn-4", "outline"),
+    Input("unk-btn-1", "outline"),
+    Input("unk-btn-2", "outline"),
+    Input("unk-btn-3", "outline"),
+    Input("unk-btn-4", "outline"),
+    Input("slider-position", "value"),
+    Input("range-slider", "value"),
+    Input("p-value", "value"),
+    Input("p-value-input", "value"),
+]
+coalesce.sequence_callback(
+    app, "graph-request-seq", *graph_inputs, prevent_initial_call=True
+)
+
+
 @app.callback(
     # Output("graph-cache", "data"),
     Output("graph", "figure", allow_duplicate=True),
     [
-        Input("pos-statfit-select", "value"),
-        Input("neg-statfit-select", "value"),
-        Input("unknown-statfit-select", "value"),
-        Input("pos-btn-1", "outline"),
-        Input("pos-btn-2", "outline"),
-        Input("pos-btn-3", "outline"),
-        Input("neg-btn-1", "outline"),
-        Input("neg-btn-2", "outline"),
-        Input("neg-btn-3", "outline"),
-        Input("unk-btn-1", "outline"),
-        Input("unk-btn-2", "outline"),
-        Input("unk-btn-3", "outline"),
-        Input("slider-position", "value"),
-        Input("range-slider", "value"),
-        Input("p-value", "value"),
-        Input("p-value-input", "value"),
-        State("labeled-data", "data"),
+        Input("graph-request-seq", "data"),
+        *graph_inputs,
         State("fit-params", "data"),
-        State("roc-curves", "data"),
         State("column-select", "value"),
+        State("file-select", "value"),
+        State("session-id", "data"),
     ],
     prevent_initial_call=True,
 )
+@instrumentation.instrument
+@coalesce.latest_only
 def update_graph_and_cache(
+    request_seq,
     pos_fit_dist,
     neg_fit_dist,
     unknown_fit_dist,
     pos_btn1_outline,
     pos_btn2_outline,
     pos_btn3_outline,
+    pos_btn4_outline,
     neg_btn1_outline,
     neg_btn2_outline,
     neg_btn3_outline,
+    neg_btn4_outline,
     unk_btn1_outline,
     unk_btn2_outline,
     unk_btn3_outline,
+    unk_btn4_outline,
     slider_value,
     range_value,
     p_value,
     p_value_input,
-    labeled_data,
     fitted_params,
-    roc_data,
     selected_column,
+    selected_file,
+    session_id,
 ):
-    if not labeled_data or not selected_column:
+    if not fitted_params or not selected_column or not selected_file:
+        raise dash.exceptions.PreventUpdate
+
+    # sorted class arrays, mapped from the shared store
+    dataset, _ = datastore.load_dataset(selected_file)
+    column_data = dataset.get(selected_column)
+    parameter_data = fitted_params.get(selected_column)
+    if column_data is None:
         raise dash.exceptions.PreventUpdate
 
+    # imported here, they are most of the startup time and only needed once a
+    # dataset is shown
+    from plotly.subplots import make_subplots
+    from scipy import stats
+
     pos_chart_types = []
     if not pos_btn1_outline:
         pos_chart_types.append("rug")
@@ -751,6 +1408,8 @@ def update_graph_and_cache(
         pos_chart_types.append("hist")
     if not pos_btn3_outline:
         pos_chart_types.append("stat")
+    if not pos_btn4_outline:
+        pos_chart_types.append("kde")
 
     neg_chart_types = []
     if not neg_btn1_outline:
@@ -759,6 +1418,8 @@ def update_graph_and_cache(
         neg_chart_types.append("hist")
     if not neg_btn3_outline:
         neg_chart_types.append("stat")
+    if not neg_btn4_outline:
+        neg_chart_types.append("kde")
 
     unknown_chart_types = []
     if not unk_btn1_outline:
@@ -767,9 +1428,8 @@ def update_graph_and_cache(
         unknown_chart_types.append("hist")
     if not unk_btn3_outline:
         unknown_chart_types.append("stat")
-
-    column_data = labeled_data.get(selected_column)
-    parameter_data = fitted_params.get(selected_column)
+    if not unk_btn4_outline:
+        unknown_chart_types.append("kde")
 
     if pos_fit_dist:
         pos_params = parameter_data["positive"][pos_fit_dist]
@@ -778,11 +1438,11 @@ def update_graph_and_cache(
     if unknown_fit_dist:
         unknown_params = parameter_data["unknown"][unknown_fit_dist]
 
-    positive_data = np.array(column_data.get("positive", {}).get("data", []))
-    negative_data = np.array(column_data.get("negative", {}).get("data", []))
-    unknown_data = np.array(column_data.get("unknown", {}).get("data", []))
-    range_min = column_data.get("range_min", 0)
-    range_max = column_data.get("range_max", 100)
+    positive_data = column_data["positive"]
+    negative_data = column_data["negative"]
+    unknown_data = column_data["unknown"]
+    range_min = column_data["range_min"]
+    range_max = column_data["range_max"]
 
     fig = make_subplots(
         rows=2,
@@ -796,24 +1456,23 @@ def update_graph_and_cache(
     if column_data and parameter_data:
         # Calculate Histogram points depending of ranger slider
         bin_edges = utils.calculate_bin_edges(range_value, range_min, range_max)
-        positive_hist, positive_bin_edges = np.histogram(
-            column_data["positive"]["data"],
-            bins=bin_edges,
-            density=True,
-        )
-        negative_hist, negative_bin_edges = np.histogram(
-            column_data["negative"]["data"],
-            bins=bin_edges,
-            density=True,
-        )
-        unknown_hist, unknown_bin_edges = np.histogram(
-            column_data["unknown"]["data"],
-            bins=bin_edges,
-            density=True,
-        )
+        positive_hist = utils.histogram_density(positive_data, bin_edges)
+        negative_hist = utils.histogram_density(negative_data, bin_edges)
+        unknown_hist = utils.histogram_density(unknown_data, bin_edges)
+        positive_bin_edges = negative_bin_edges = unknown_bin_edges = bin_edges
 
         graph_max_height = 0
 
+        # kernel density estimates of the whole class, drawn across the viewport
+        x_range_for_kde = np.linspace(range_value[0], range_value[1], 300)
+
+        def class_kde(label):
+            kde = datastore.load_kde(selected_file, selected_column, label)
+            if kde is None:
+                return np.zeros(x_range_for_kde.size)
+            grid, density = kde
+            return np.interp(x_range_for_kde, grid, density, left=0, right=0)
+
         positive_bar_widths = np.diff(positive_bin_edges)
         negative_bar_widths = np.diff(negative_bin_edges)
         unknown_bar_widths = np.diff(unknown_bin_edges)
@@ -827,7 +1486,7 @@ def update_graph_and_cache(
             if "rug" in unknown_chart_types:
                 fig.add_trace(
                     go.Box(
-                        x=column_data["unknown"]["data"],
+                        x=unknown_data,
                         marker_symbol="line-ns-open",
                         marker_color=UNKNOWN,
                         boxpoints="all",
@@ -882,13 +1541,30 @@ def update_graph_and_cache(
                     row=1,
                     col=1,
                 )
+            if "kde" in unknown_chart_types:
+                unknown_kde = class_kde("unknown")
+                if max(unknown_kde) > graph_max_height:
+                    graph_max_height = max(unknown_kde)
+                fig.add_trace(
+                    go.Scatter(
+                        x=x_range_for_kde,
+                        y=unknown_kde,
+                        mode="lines",
+                        name="Unknown",
+                        line_color=UNKNOWN,
+                        line_dash="dash",
+                        hoverinfo="none",
+                    ),
+                    row=1,
+                    col=1,
+                )
 
         # Negative Trace
         if negative_data.size > 0:
             if "rug" in neg_chart_types:
                 fig.add_trace(
                     go.Box(
-                        x=column_data["negative"]["data"],
+                        x=negative_data,
                         marker_symbol="line-ns-open",
                         marker_color=NEGATIVE,
                         boxpoints="all",
@@ -940,13 +1616,30 @@ def update_graph_and_cache(
                     row=1,
                     col=1,
                 )
+            if "kde" in neg_chart_types:
+                negative_kde = class_kde("negative")
+                if max(negative_kde) > graph_max_height:
+                    graph_max_height = max(negative_kde)
+                fig.add_trace(
+                    go.Scatter(
+                        x=x_range_for_kde,
+                        y=negative_kde,
+                        mode="lines",
+                        name="Negative",
+                        line_color=NEGATIVE,
+                        line_dash="dash",
+                        hoverinfo="none",
+                    ),
+                    row=1,
+                    col=1,
+                )
 
         # Positive Trace
         if positive_data.size > 0:
             if "rug" in pos_chart_types:
                 fig.add_trace(
                     go.Box(
-                        x=column_data["positive"]["data"],
+                        x=positive_data,
                         marker_symbol="line-ns-open",
                         marker_color=POSITIVE,
                         boxpoints="all",
@@ -998,6 +1691,23 @@ def update_graph_and_cache(
                     row=1,
                     col=1,
                 ),
+            if "kde" in pos_chart_types:
+                positive_kde = class_kde("positive")
+                if max(positive_kde) > graph_max_height:
+                    graph_max_height = max(positive_kde)
+                fig.add_trace(
+                    go.Scatter(
+                        x=x_range_for_kde,
+                        y=positive_kde,
+                        mode="lines",
+                        name="Positive",
+                        line_color=POSITIVE,
+                        line_dash="dash",
+                        hoverinfo="none",
+                    ),
+                    row=1,
+                    col=1,
+                )
 
         graph_yaxis_range = [0, graph_max_height * 1.1]
 
@@ -1105,7 +1815,8 @@ def update_graph_and_cache(
 
 def check_for_processed_files(data):
     processed_files = []
-    required_files = list(SAVED_FILE_NAMES.values())
+    required_files = set(SAVED_FILE_NAMES.values())
+    optional_files = set(OPTIONAL_FILE_NAMES.values())
 
     if not os.path.isdir(data):
         return False
@@ -1113,20 +1824,36 @@ def check_for_processed_files(data):
     folders = [
         os.path.join(data, f)
         for f in os.listdir(data)
-        if os.path.isdir(os.path.join(data, f))
+        if os.path.isdir(os.path.join(data, f)) and not f.startswith(".")
     ]
     for folder in folders:
-        if set(os.listdir(folder)) == set(required_files + [os.path.split(folder)[1]]):
-            processed_files.append(os.path.split(folder)[1])
+        filename = os.path.split(folder)[1]
+        # hidden files are temporary files of background jobs
+        files = {
+            f for f in os.listdir(folder) if not f.startswith(".")
+        } - optional_files
+        if files == required_files | {filename}:
+            processed_files.append(filename)
     return processed_files
 
 
+@callback(
+    Output("session-id", "data"),
+    Input("loadup-dummy", "children"),
+    State("session-id", "data"),
+)
+def init_session_id(dummy, session_id):
+    # one id per browser tab, kept across page reloads
+    return session_id or coalesce.new_session_id()
+
+
 @callback(
     Output("processed-files-list", "data"),
     Input("loadup-dummy", "children"),
     prevent_initial_call=False,
 )
 def load_data(dummy):
+    storage.remove_leftovers()
     return check_for_processed_files(DATA_FOLDER)
 
 
@@ -15,3 +15,15 @@ dagcomponentfuncs.Button = function (props) {
         props.value
     );
 };
+
+dagcomponentfuncs.Link = function (props) {
+    return React.createElement(
+        'a',
+        {
+            href: props.value,
+            className: props.className,
+            download: '',
+        },
+        props.label
+    );
+};
@@ -0,0 +1,125 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a worker of the preloaded server (gunicorn.conf.py) is forked from a process
+# that has imported the app, a restart costs the fork and the first page load.
+# Prints its own time, the import before the fork is not part of it.
+WORKER_RESTART = """
+import os, time, wsgi
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    client = wsgi.application.test_client()
+    ok = all(client.get(url).status_code == 200 for url in ("/", "/_dash-layout"))
+    os._exit(0 if ok else 1)
+_, status = os.waitpid(pid, 0)
+print(time.perf_counter() - start)
+os._exit(status >> 8)
+"""
+
+# (command, working directory) of every target, each run in a fresh interpreter.
+# The server targets exit without tearing the interpreter down, a server
+# never pays for that before it handles its first request.
+TARGETS = {
+    "worker": ([sys.executable, "-c", WORKER_RESTART], PACKAGE_DIR),
+    "cli": (
+        [sys.executable, "-m", os.path.basename(PACKAGE_DIR), "--help"],
+        os.path.dirname(PACKAGE_DIR),
+    ),
+    "app": ([sys.executable, "-c", "import os, app; os._exit(0)"], PACKAGE_DIR),
+    "wsgi": ([sys.executable, "-c", "import os, wsgi; os._exit(0)"], PACKAGE_DIR),
+}
+
+# cold imports of the whole app, reported but not held to --limit. Dash and
+# pandas alone take most of a second, a server pays this once and forks its
+# workers from it.
+COLD_STARTS = {"app", "wsgi"}
+
+
+def measure(target, repeat):
+    command, cwd = TARGETS[target]
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            command, cwd=cwd, check=True, capture_output=True, text=True
+        )
+        if target == "worker":
+            seconds.append(float(result.stdout))
+        else:
+            seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def slowest_imports(target, top):
+    # cumulative import time of the modules imported directly by the target
+    command, cwd = TARGETS[target]
+    result = subprocess.run(
+        [command[0], "-X", "importtime"] + command[1:],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # one level of indentation below the target itself
+        if name.startswith("   ") and not name.startswith("    "):
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="time a worker restart, the cli and cold starts of the app"
+    )
+    parser.add_argument(
+        "--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS)
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--limit",
+        type=float,
+        default=1.0,
+        help="median seconds above which the worker or cli fails (exit code 1)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="also list the N slowest top level imports of every target",
+    )
+    args = parser.parse_args()
+
+    # the first start compiles the bytecode, it is not counted
+    for target in args.targets:
+        measure(target, 1)
+
+    failed = []
+    print(f"{'target':<8} {'median':>10} {'min':>10}")
+    for target in args.targets:
+        seconds = measure(target, args.repeat)
+        median = statistics.median(seconds)
+        flag = ""
+        if target in COLD_STARTS:
+            flag = "  (cold start, not limited)"
+        elif median > args.limit:
+            flag = "  <-- over limit"
+            failed.append(target)
+        print(f"{target:<8} {median:9.3f}s {min(seconds):9.3f}s{flag}")
+        if target != "worker":
+            for import_seconds, name in slowest_imports(target, args.top):
+                print(f"    {name:<40} {import_seconds:9.3f}s")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,227 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+
+# (rows, columns, kind) for every synthetic dataset. kind is one of
+# "default", "ties" (few distinct values) or "unknowns" (mostly unlabeled rows).
+PRESETS = {
+    "quick": [
+        (1_000, 1, "default"),
+        (10_000, 1, "default"),
+        (10_000, 10, "default"),
+        (10_000, 1, "ties"),
+        (10_000, 1, "unknowns"),
+    ],
+    "full": [
+        (1_000, 1, "default"),
+        (10_000, 1, "default"),
+        (100_000, 1, "default"),
+        (1_000_000, 1, "default"),
+        (10_000_000, 1, "default"),
+        (1_000, 500, "default"),
+        (10_000, 100, "default"),
+        (100_000, 10, "default"),
+        (1_000_000, 1, "ties"),
+        (1_000_000, 1, "unknowns"),
+    ],
+}
+
+FUNCTIONS = [
+    "label_data",
+    "make_roc_curve",
+    "fit_params",
+    "plot_roc_curve",
+    "gen_roc_table",
+    "calculate_bin_edges",
+]
+
+
+def case_name(rows, cols, kind):
+    return f"{rows}x{cols}-{kind}"
+
+
+def make_dataset(rows, cols, kind, seed):
+    kinds = ["default", "ties", "unknowns"]
+    rng = np.random.default_rng([seed, rows, cols, kinds.index(kind)])
+
+    if kind == "unknowns":
+        label_p = [0.05, 0.05, 0.9]
+    else:
+        label_p = [0.3, 0.3, 0.4]
+    reference_result = rng.choice([1.0, -1.0, 0.0], size=rows, p=label_p)
+    # empty reference_result cells are treated as unknown by label_data
+    reference_result[rng.random(rows) < 0.02] = np.nan
+
+    data = {"reference_result": reference_result}
+    shift = np.where(reference_result > 0, 2.0, 0.0)
+    for i in range(cols):
+        values = rng.lognormal(mean=shift * 0.5, sigma=0.6, size=rows) * 10
+        if kind == "ties":
+            values = np.round(values / 5) * 5
+        data[f"marker_{i:03d}"] = values
+    return pd.DataFrame(data)
+
+
+def prepare(df):
+    labeled_data = utils.label_data(df.copy())
+    roc_curves = utils.make_roc_curve(labeled_data)
+    fitted_params = utils.fit_params(
+        {col: labeled_data[col] for col in list(labeled_data)[:1]}
+    )
+    column = list(labeled_data)[0]
+    return labeled_data, roc_curves, fitted_params, column
+
+
+def make_calls(df, state):
+    labeled_data, roc_curves, fitted_params, column = state
+    roc_column = roc_curves[column]
+    col_data = labeled_data[column]
+    range_min = col_data["range_min"]
+    range_max = col_data["range_max"]
+    # a zoomed in view of the middle tenth of the range
+    width = range_max - range_min
+    range_value = [range_min + 0.45 * width, range_min + 0.55 * width]
+    threshold = float(np.median(df[column]))
+    threshold_index = len(roc_column["population_data"]) // 2
+    norm_params = fitted_params[column]["positive"]["norm"]
+
+    return {
+        "label_data": lambda: utils.label_data(df.copy()),
+        "make_roc_curve": lambda: utils.make_roc_curve(labeled_data),
+        "fit_params": lambda: utils.fit_params(labeled_data),
+        "plot_roc_curve": lambda: utils.plot_roc_curve(
+            roc_column, threshold_index, True
+        ),
+        "gen_roc_table": lambda: utils.gen_roc_table(
+            roc_column, threshold, norm_params
+        ),
+        "calculate_bin_edges": lambda: utils.calculate_bin_edges(
+            range_value, range_min, range_max
+        ),
+    }
+
+
+def measure(func, repeat):
+    # fast functions are looped until a run takes at least 0.2 s, like timeit
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat, number)) / number
+
+    # peak memory is measured in a separate run, tracemalloc slows calls down
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak / 1024**2
+
+
+def run(cases, functions, repeat, seed):
+    results = []
+    for rows, cols, kind in cases:
+        name = case_name(rows, cols, kind)
+        df = make_dataset(rows, cols, kind, seed)
+        calls = make_calls(df, prepare(df))
+        for function in functions:
+            seconds, peak_mb = measure(calls[function], repeat)
+            results.append(
+                {
+                    "case": name,
+                    "function": function,
+                    "seconds": seconds,
+                    "peak_mb": peak_mb,
+                }
+            )
+            print(f"{name:<24} {function:<20} {seconds:10.4f} s {peak_mb:10.2f} MB")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    baseline_results = {
+        (r["case"], r["function"]): r for r in baseline.get("results", [])
+    }
+    regressions = []
+    print()
+    print(f"{'case':<24} {'function':<20} {'time':>10} {'memory':>10}")
+    for r in results:
+        old = baseline_results.get((r["case"], r["function"]))
+        if old is None:
+            continue
+        time_ratio = r["seconds"] / old["seconds"] if old["seconds"] else float("nan")
+        mem_ratio = r["peak_mb"] / old["peak_mb"] if old["peak_mb"] else float("nan")
+        flag = ""
+        if time_ratio > tolerance or mem_ratio > tolerance:
+            flag = "  <-- regression"
+            regressions.append(r)
+        print(
+            f"{r['case']:<24} {r['function']:<20} {time_ratio:9.2f}x {mem_ratio:9.2f}x{flag}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="benchmark the utils hot paths on seeded synthetic datasets"
+    )
+    parser.add_argument("--preset", choices=list(PRESETS), default="quick")
+    parser.add_argument(
+        "--case",
+        action="append",
+        help="extra case as rows,columns,kind e.g. 100000,5,ties (can be repeated)",
+    )
+    parser.add_argument(
+        "--functions", nargs="+", choices=FUNCTIONS, default=FUNCTIONS
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write results to this json file")
+    parser.add_argument("--baseline", help="compare results against this json file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.2,
+        help="ratio to baseline above which a result counts as a regression",
+    )
+    args = parser.parse_args()
+
+    cases = list(PRESETS[args.preset])
+    for case in args.case or []:
+        rows, cols, kind = case.split(",")
+        cases.append((int(rows), int(cols), kind))
+
+    results = run(cases, args.functions, args.repeat, args.seed)
+
+    if args.save:
+        output = {
+            "meta": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "machine": platform.machine(),
+                "preset": args.preset,
+                "seed": args.seed,
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,162 @@
+import os
+import warnings
+
+import numpy as np
+
+import pools
+
+# Stratified bootstrap of the ROC curve: positives and negatives are resampled
+# separately, so every replicate keeps the class sizes of the file. The values
+# are binned at a grid of thresholds, a replicate is then a multinomial draw of
+# the bin counts of each class, which is the same as resampling the samples
+# themselves but costs O(bins) instead of O(N) and runs for a whole chunk of
+# replicates in one numpy call.
+
+REPLICATES = int(os.environ.get("VV_BOOTSTRAP_REPLICATES", 1000))
+CONFIDENCE = 0.95
+SEED = 20240917
+
+# replicates per task, fixed so the intervals do not depend on the worker count
+CHUNK_SIZE = 100
+
+# thresholds the metrics are resampled at, quantiles of both classes when there
+# are more distinct values than this (AUC ties within a bin then count as half)
+MAX_THRESHOLDS = 2048
+
+# specificities of the pointwise band around the ROC curve
+BAND_POINTS = 101
+
+BOOTSTRAP_WORKERS = int(
+    os.environ.get("VV_BOOTSTRAP_WORKERS", min(os.cpu_count() or 1, 4))
+)
+
+def threshold_grid(positive, negative, max_thresholds=MAX_THRESHOLDS):
+    values = np.union1d(positive, negative)
+    if values.size > max_thresholds:
+        values = np.unique(np.quantile(values, np.linspace(0, 1, max_thresholds)))
+    return values
+
+
+def bin_counts(sorted_data, thresholds):
+    # bin j holds the values in [thresholds[j - 1], thresholds[j]), the first
+    # and last bins everything below and above the grid
+    positions = np.searchsorted(sorted_data, thresholds, side="left")
+    return np.diff(positions, prepend=0, append=len(sorted_data))
+
+
+def _metrics(pos_counts, neg_counts, mirrored):
+    # rows are replicates, columns the thresholds and a last one above all of
+    # them. A sample is called positive at or above a threshold, below it when
+    # mirrored (as in roc_core.gen_roc_table).
+    total_positive = pos_counts.sum(axis=1, keepdims=True)
+    total_negative = neg_counts.sum(axis=1, keepdims=True)
+    pos_below = np.cumsum(pos_counts, axis=1)
+    neg_below = np.cumsum(neg_counts, axis=1)
+    if mirrored:
+        tp, fp = pos_below, neg_below
+    else:
+        tp, fp = total_positive - pos_below, total_negative - neg_below
+    sensitivity = tp / total_positive
+    specificity = 1 - fp / total_negative
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ppv = tp / (tp + fp)
+
+    # pairs of a positive and a negative ranked the right way round, pairs in
+    # the same bin count as half
+    neg_lower = neg_below - neg_counts
+    concordant = (pos_counts * (neg_lower + 0.5 * neg_counts)).sum(axis=1)
+    auc = concordant / (total_positive[:, 0] * total_negative[:, 0])
+    if mirrored:
+        auc = 1 - auc
+    return sensitivity, specificity, ppv, auc
+
+
+def _band(sensitivity, specificity, grid):
+    # sensitivity of every replicate at the specificities of the grid, the
+    # curves run from (0, 1) to (1, 0)
+    band = np.empty((sensitivity.shape[0], grid.size))
+    for i, (sens, spec) in enumerate(zip(sensitivity, specificity)):
+        spec = np.concatenate([[0.0], spec, [1.0]])
+        sens = np.concatenate([[1.0], sens, [0.0]])
+        order = np.argsort(spec, kind="stable")
+        band[i] = np.interp(grid, spec[order], sens[order])
+    return band
+
+
+def resample(pos_bins, neg_bins, mirrored, seed, replicates, band_grid):
+    # one chunk of replicates: (sensitivity, specificity, ppv) per threshold,
+    # auc and the sensitivity at band_grid, one row per replicate
+    rng = np.random.default_rng(seed)
+    n_pos, n_neg = pos_bins.sum(), neg_bins.sum()
+    pos_counts = rng.multinomial(n_pos, pos_bins / n_pos, size=replicates)
+    neg_counts = rng.multinomial(n_neg, neg_bins / n_neg, size=replicates)
+    sensitivity, specificity, ppv, auc = _metrics(pos_counts, neg_counts, mirrored)
+    band = _band(sensitivity, specificity, band_grid)
+    return sensitivity, specificity, ppv, auc, band
+
+
+def bootstrap_roc(
+    positive,
+    negative,
+    mirrored,
+    replicates=REPLICATES,
+    confidence=CONFIDENCE,
+    seed=SEED,
+    max_workers=BOOTSTRAP_WORKERS,
+):
+    # percentile intervals of the AUC, of the metrics at every threshold of
+    # threshold_grid (and above the last one) and of the sensitivity along the
+    # ROC curve. Classes must be sorted and not empty.
+    thresholds = threshold_grid(positive, negative)
+    pos_bins = bin_counts(positive, thresholds)
+    neg_bins = bin_counts(negative, thresholds)
+    band_grid = np.linspace(0, 1, BAND_POINTS)
+
+    sizes = [CHUNK_SIZE] * (replicates // CHUNK_SIZE)
+    if replicates % CHUNK_SIZE:
+        sizes.append(replicates % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [
+        (pos_bins, neg_bins, mirrored, chunk_seed, size, band_grid)
+        for chunk_seed, size in zip(seeds, sizes)
+    ]
+    if max_workers > 1 and len(tasks) > 1:
+        chunks = pools.run(
+            "bootstrap", max_workers, [(resample, *task) for task in tasks]
+        )
+    else:
+        chunks = [resample(*task) for task in tasks]
+    sensitivity, specificity, ppv, auc, band = (
+        np.concatenate(arrays) for arrays in zip(*chunks)
+    )
+
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+
+    def interval(samples):
+        # (lower, upper), replicates without a value (no positive calls for
+        # the PPV) are left out
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            lower, upper = np.nanquantile(samples, quantiles, axis=0)
+        return lower, upper
+
+    return {
+        "thresholds": thresholds,
+        "sensitivity": interval(sensitivity),
+        "specificity": interval(specificity),
+        "ppv": interval(ppv),
+        "auc": tuple(float(v) for v in np.quantile(auc, quantiles)),
+        "band_specificity": band_grid,
+        "band_sensitivity": interval(band),
+        "replicates": replicates,
+        "confidence": confidence,
+        "seed": seed,
+    }
+
+
+def interval_at(intervals, metric, threshold):
+    # (lower, upper) of a metric at a threshold. The calls at a threshold are
+    # those at the next grid threshold, exact unless the grid was thinned out.
+    index = np.searchsorted(intervals["thresholds"], threshold, side="left")
+    lower, upper = intervals[metric]
+    return float(lower[index]), float(upper[index])
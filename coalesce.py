@@ -0,0 +1,113 @@
+import contextlib
+import functools
+import os
+import time
+import uuid
+
+from dash import Output, State
+from dash.exceptions import PreventUpdate
+
+import storage
+
+# Dragging a slider sends a request for every step. The browser numbers the
+# requests of a coalesced callback (see sequence_callback), a request that is
+# overtaken by a newer one of the same session stops without updating the page.
+# Requests reach the server out of order, so the numbers rather than the time
+# of arrival tell which is newer. The newest number of every session is kept in
+# a file, so the workers of a multi-process server see each other's.
+TICKET_FOLDER = os.path.join(storage.CACHE_FOLDER, "tickets")
+
+# time a request waits for a newer one before it starts working, set
+# VV_COALESCE_SETTLE=0 to turn the wait off
+SETTLE_SECONDS = float(os.environ.get("VV_COALESCE_SETTLE", 0.03))
+
+# tickets of sessions idle for longer than this are removed
+TICKET_MAX_AGE = 24 * 60 * 60
+
+_last_cleanup = 0.0
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def _ticket_path(session_id, name):
+    return os.path.join(TICKET_FOLDER, f"{session_id}-{name}")
+
+
+def _remove_old_tickets():
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < 60 * 60:
+        return
+    _last_cleanup = now
+    for ticket in os.listdir(TICKET_FOLDER):
+        path = os.path.join(TICKET_FOLDER, ticket)
+        with contextlib.suppress(FileNotFoundError):
+            if now - os.path.getmtime(path) > TICKET_MAX_AGE:
+                os.remove(path)
+
+
+def take_ticket(session_id, name, ticket):
+    # records the request number unless a newer request was seen already
+    os.makedirs(TICKET_FOLDER, exist_ok=True)
+    _remove_old_tickets()
+    with storage.file_lock("ticket-" + name):
+        if latest_ticket(session_id, name) < ticket:
+            storage.write_atomic(
+                _ticket_path(session_id, name),
+                lambda f: f.write(str(ticket).encode()),
+            )
+
+
+def latest_ticket(session_id, name):
+    try:
+        with open(_ticket_path(session_id, name)) as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def check_ticket(session_id, name, ticket):
+    # PreventUpdate once a newer request of the session has started
+    if latest_ticket(session_id, name) > ticket:
+        raise PreventUpdate
+
+
+def latest_only(func):
+    # for callbacks whose first argument is the request number (the store of
+    # sequence_callback) and whose last is the session id (State("session-id",
+    # "data")), requests overtaken by a newer one leave the page as it is
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        ticket, session_id = (args[0], args[-1]) if args else (None, None)
+        if not session_id or ticket is None:
+            return func(*args, **kwargs)
+        take_ticket(session_id, name, ticket)
+        if SETTLE_SECONDS:
+            time.sleep(SETTLE_SECONDS)
+        check_ticket(session_id, name, ticket)
+        result = func(*args, **kwargs)
+        # a newer request started while this one ran, its result is the one
+        # that counts and this one need not be sent
+        check_ticket(session_id, name, ticket)
+        return result
+
+    return wrapper
+
+
+def sequence_callback(app, store_id, *inputs, prevent_initial_call=False):
+    # numbers the changes of inputs in the browser, in the order they are made.
+    # A coalesced callback with the same inputs takes Input(store_id, "data")
+    # first, Dash then runs it after the number is set. The store is kept in
+    # the session storage like the session id, so numbers keep rising across
+    # page reloads.
+    app.clientside_callback(
+        "function() { return (arguments[arguments.length - 1] || 0) + 1; }",
+        Output(store_id, "data"),
+        *inputs,
+        State(store_id, "data"),
+        prevent_initial_call=prevent_initial_call,
+    )
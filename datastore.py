@@ -0,0 +1,410 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import bootstrap
+import roc_core
+import instrumentation
+import storage
+from storage import ARRAY_FOLDER, DATA_FOLDER, SAVED_FILE_NAMES
+
+# arrays of a column, saved as .npy files that every server process maps
+# read-only, so the operating system keeps one copy per dataset in its page cache
+CLASS_ARRAYS = ["positive", "negative", "unknown"]
+COUNT_ARRAYS = ["values", "acc_positive", "acc_negative", "acc_unknown"]
+
+MAX_CACHED_FILES = 16  # mapped datasets, only the mapping itself is per process
+MAX_CACHED_CURVES = 256  # decimated curves, a few KB each
+MAX_CACHED_ROC = 4  # list based curves of whole columns, 100 bytes per row
+MAX_CACHED_DENSITIES = 256  # kernel density grids, 16 KB each
+MAX_CACHED_INTERVALS = 64  # bootstrap intervals, about 100 KB each
+MAX_CACHED_COMPARISONS = 64  # DeLong tests of a set of columns
+MAX_CACHED_RAW = 16  # raw data columns the grid filters are evaluated on
+MAX_CACHED_MASKS = 64  # rows passing a grid filter, a byte per row
+MAX_CACHED_FILTERED = 32  # sorted class arrays of filtered rows, 8 bytes per row
+
+_lock = threading.Lock()
+_datasets = OrderedDict()
+_curves = OrderedDict()
+_roc = OrderedDict()
+_densities = OrderedDict()
+_intervals = OrderedDict()
+_comparisons = OrderedDict()
+_raw = OrderedDict()
+_masks = OrderedDict()
+_filtered = OrderedDict()
+
+
+def _lru_get(cache, key):
+    with _lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    return None
+
+
+def _lru_put(cache, key, value, maxsize):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+
+def _labeled_data_path(filename):
+    return os.path.join(DATA_FOLDER, filename, SAVED_FILE_NAMES["labeled data"])
+
+
+def dataset_key(filename):
+    # the modification time makes a reprocessed file a new key. Taken without
+    # the lock it only names cache entries, whatever is computed is keyed by
+    # the time read under the shared lock.
+    return (filename, os.stat(_labeled_data_path(filename)).st_mtime_ns)
+
+
+def _array_dir_name(key):
+    filename, mtime_ns = key
+    return f"{storage.cache_prefix(filename)}{mtime_ns}"
+
+
+def _column_arrays(data):
+    # sorted values of all classes with the cumulative counts of each class, the
+    # arrays behind the roc_curves.pkl lists
+    classes = [np.asarray(data[label]["data"], dtype=float) for label in CLASS_ARRAYS]
+    values = np.concatenate(classes)
+    labels = np.repeat(np.arange(3), [c.size for c in classes])
+    order = np.argsort(values, kind="stable")
+    labels = labels[order]
+    arrays = {label: c for label, c in zip(CLASS_ARRAYS, classes)}
+    arrays["values"] = values[order]
+    for i, label in enumerate(CLASS_ARRAYS):
+        arrays["acc_" + label] = np.cumsum(labels == i)
+    return arrays
+
+
+def _write_arrays(filename, array_dir):
+    # callers hold the shared lock of the file
+    with open(_labeled_data_path(filename), "rb") as f:
+        labeled_data = pickle.load(f)
+
+    os.makedirs(ARRAY_FOLDER, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=ARRAY_FOLDER, prefix=".")
+    try:
+        index = []
+        for i, (column, data) in enumerate(labeled_data.items()):
+            arrays = _column_arrays(data)
+            os.makedirs(os.path.join(tmp_dir, str(i)))
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, str(i), name + ".npy"), array)
+            positive, negative = arrays["positive"], arrays["negative"]
+            index.append(
+                {
+                    "column": column,
+                    "dir": str(i),
+                    "total_positive": int(positive.size),
+                    "total_negative": int(negative.size),
+                    "total_unknown": int(arrays["unknown"].size),
+                    # same rule as roc_core.make_roc_curve
+                    "mirrored": bool(
+                        positive.size
+                        and negative.size
+                        and np.median(positive) <= np.median(negative)
+                    ),
+                    "range_min": data["range_min"],
+                    "range_max": data["range_max"],
+                }
+            )
+        with open(os.path.join(tmp_dir, "index.json"), "w") as f:
+            json.dump(index, f)
+        os.rename(tmp_dir, array_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # arrays of earlier uploads of the same file, processes still mapping them
+    # keep their pages until they let go
+    prefix = storage.cache_prefix(filename)
+    for name in os.listdir(ARRAY_FOLDER):
+        if name.startswith(prefix) and name != os.path.basename(array_dir):
+            shutil.rmtree(os.path.join(ARRAY_FOLDER, name), ignore_errors=True)
+
+
+def load_dataset(filename):
+    # {column: {"positive", "negative", "unknown", "values", "acc_positive",
+    # "acc_negative", "acc_unknown" (read-only arrays), "total_positive",
+    # "total_negative", "total_unknown", "mirrored", "range_min", "range_max"}}
+    key = dataset_key(filename)
+    dataset = _lru_get(_datasets, key)
+    instrumentation.record_cache(dataset is not None)
+    if dataset is not None:
+        return dataset, key
+
+    with storage.file_lock(filename, shared=True):
+        # taken again under the lock, the arrays are of the version on disk
+        key = dataset_key(filename)
+        array_dir = os.path.join(ARRAY_FOLDER, _array_dir_name(key))
+        if not os.path.isdir(array_dir):
+            # the first process to get here writes the arrays, the others wait
+            # and map them
+            with storage.file_lock(_array_dir_name(key)):
+                if not os.path.isdir(array_dir):
+                    _write_arrays(filename, array_dir)
+
+    with open(os.path.join(array_dir, "index.json")) as f:
+        index = json.load(f)
+    dataset = {}
+    for entry in index:
+        column = dict(entry)
+        column_dir = os.path.join(array_dir, column.pop("dir"))
+        for name in CLASS_ARRAYS + COUNT_ARRAYS:
+            column[name] = np.load(
+                os.path.join(column_dir, name + ".npy"), mmap_mode="r"
+            )
+        dataset[column.pop("column")] = column
+    _lru_put(_datasets, key, dataset, MAX_CACHED_FILES)
+    return dataset, key
+
+
+def _disk_key(key, column, suffix):
+    column_hash = hashlib.sha1(str(column).encode("utf-8")).hexdigest()[:16]
+    return f"{_array_dir_name(key)}-{column_hash}-{suffix}"
+
+
+def load_decimated_curves(filename, columns, max_points=400):
+    # {column: {"tnr", "tpr", "thresholds", "auc", "mirrored"}}, columns without
+    # positive and negative samples are left out
+    curves = {}
+    dataset = None
+    key = dataset_key(filename)
+    for column in columns:
+        curve = _lru_get(_curves, (key, column, max_points))
+        if curve is None:
+            # computed by another server process
+            curve = storage.cache_get(_disk_key(key, column, max_points))
+            if curve is not None:
+                _lru_put(_curves, (key, column, max_points), curve, MAX_CACHED_CURVES)
+        instrumentation.record_cache(curve is not None)
+        if curve is None:
+            if dataset is None:
+                dataset, key = load_dataset(filename)
+            arrays = dataset.get(column)
+            curve = {}
+            if arrays and arrays["total_positive"] and arrays["total_negative"]:
+                tnr, tpr, thresholds = roc_core.roc_arrays_from_counts(
+                    arrays["values"],
+                    arrays["acc_positive"],
+                    arrays["acc_negative"],
+                    arrays["total_positive"],
+                    arrays["total_negative"],
+                    arrays["mirrored"],
+                )
+                auc = roc_core.roc_auc(tnr, tpr)
+                tnr, tpr, thresholds = roc_core.decimate_roc(
+                    tnr, tpr, thresholds, max_points
+                )
+                curve = {
+                    "tnr": tnr,
+                    "tpr": tpr,
+                    "thresholds": thresholds,
+                    "auc": auc,
+                    "mirrored": arrays["mirrored"],
+                }
+            _lru_put(_curves, (key, column, max_points), curve, MAX_CACHED_CURVES)
+            storage.cache_put(_disk_key(key, column, max_points), curve)
+        if curve:
+            curves[column] = curve
+    return curves
+
+
+def load_roc_curve(filename, column):
+    # make_roc_curve of a column (see roc_core.roc_curve_from_sorted), None if
+    # the file has no such column. Built from the mapped arrays once per
+    # dataset, so the slider does not send the curve back and forth.
+    key = dataset_key(filename)
+    curve = _lru_get(_roc, (key, column))
+    instrumentation.record_cache(curve is not None)
+    if curve is None:
+        dataset, key = load_dataset(filename)
+        arrays = dataset.get(column)
+        if arrays is None:
+            return None
+        curve = roc_core.roc_curve_from_sorted(
+            {label: {"data": arrays[label]} for label in CLASS_ARRAYS}
+        )
+        _lru_put(_roc, (key, column), curve, MAX_CACHED_ROC)
+    return curve
+
+
+def load_kde(filename, column, label, bandwidth=None):
+    # (grid, density) of a class of a column, see roc_core.kde_grid. Computed
+    # once per dataset, column, class and bandwidth (None for the rule of thumb)
+    key = dataset_key(filename)
+    cache_key = (key, column, label, bandwidth)
+    disk_key = _disk_key(key, column, f"kde-{label}-{bandwidth}")
+    kde = _lru_get(_densities, cache_key)
+    if kde is None:
+        kde = storage.cache_get(disk_key)
+        if kde is not None:
+            _lru_put(_densities, cache_key, kde, MAX_CACHED_DENSITIES)
+    instrumentation.record_cache(kde is not None)
+    if kde is None:
+        dataset, key = load_dataset(filename)
+        cache_key = (key, column, label, bandwidth)
+        disk_key = _disk_key(key, column, f"kde-{label}-{bandwidth}")
+        kde = roc_core.kde_grid(dataset[column][label], bandwidth)
+        # an empty class is cached too, as an empty tuple
+        kde = kde or ()
+        _lru_put(_densities, cache_key, kde, MAX_CACHED_DENSITIES)
+        storage.cache_put(disk_key, kde)
+    return kde or None
+
+
+def load_bootstrap(filename, column):
+    # bootstrap intervals of a column, see bootstrap.bootstrap_roc, None when a
+    # class is empty. Resampled once per dataset and column, the slider only
+    # looks them up.
+    key = dataset_key(filename)
+    disk_key = _disk_key(
+        key, column, f"bootstrap-{bootstrap.REPLICATES}-{bootstrap.SEED}"
+    )
+    intervals = _lru_get(_intervals, (key, column))
+    if intervals is None:
+        intervals = storage.cache_get(disk_key)
+        if intervals is not None:
+            _lru_put(_intervals, (key, column), intervals, MAX_CACHED_INTERVALS)
+    instrumentation.record_cache(intervals is not None)
+    if intervals is None:
+        dataset, key = load_dataset(filename)
+        disk_key = _disk_key(
+            key, column, f"bootstrap-{bootstrap.REPLICATES}-{bootstrap.SEED}"
+        )
+        arrays = dataset.get(column)
+        intervals = {}
+        if arrays and arrays["total_positive"] and arrays["total_negative"]:
+            intervals = bootstrap.bootstrap_roc(
+                arrays["positive"], arrays["negative"], arrays["mirrored"]
+            )
+        _lru_put(_intervals, (key, column), intervals, MAX_CACHED_INTERVALS)
+        storage.cache_put(disk_key, intervals)
+    return intervals or None
+
+
+def read_raw_data(filename, columns=None):
+    # raw data of the upload with the rows of every appended batch and the
+    # reference results changed in the file viewer, callers hold the shared
+    # lock of the file
+    frames = [
+        pd.read_feather(path, columns=columns)
+        for path in storage.raw_data_paths(filename)
+    ]
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    relabels = storage.read_relabels(filename)
+    if relabels and "reference_result" in df.columns:
+        rows = np.fromiter(relabels.keys(), dtype=np.int64, count=len(relabels))
+        values = np.fromiter(relabels.values(), dtype=float, count=len(relabels))
+        df.iloc[rows, df.columns.get_loc("reference_result")] = values
+    return df
+
+
+def load_delong(filename, columns):
+    # paired DeLong tests between the columns, see roc_core.delong_compare. The
+    # class arrays are sorted per column and lose which values belong to the
+    # same case, so the tests read the columns from the raw data.
+    columns = sorted(columns, key=str)
+    key = dataset_key(filename)
+    disk_key = _disk_key(key, tuple(columns), "delong")
+    comparison = _lru_get(_comparisons, (key, tuple(columns)))
+    if comparison is None:
+        comparison = storage.cache_get(disk_key)
+        if comparison is not None:
+            _lru_put(
+                _comparisons, (key, tuple(columns)), comparison, MAX_CACHED_COMPARISONS
+            )
+    instrumentation.record_cache(comparison is not None)
+    if comparison is None:
+        with storage.file_lock(filename, shared=True):
+            key = dataset_key(filename)
+            try:
+                df = read_raw_data(filename, columns + ["reference_result"])
+            except ValueError:
+                # files without reference_result have no classes to compare
+                df = None
+        disk_key = _disk_key(key, tuple(columns), "delong")
+        comparison = {}
+        if df is not None:
+            comparison = roc_core.delong_compare(df, columns) or {}
+        _lru_put(
+            _comparisons, (key, tuple(columns)), comparison, MAX_CACHED_COMPARISONS
+        )
+        storage.cache_put(disk_key, comparison)
+    return comparison or None
+
+
+def load_raw_columns(filename, columns):
+    # columnar copy of the raw data columns for the grid filters, every column
+    # is read once per dataset. Columns the file does not have are left out.
+    import pyarrow.feather as feather
+
+    with storage.file_lock(filename, shared=True):
+        key = dataset_key(filename)
+        frame = {column: _lru_get(_raw, (key, column)) for column in columns}
+        missing = [column for column, values in frame.items() if values is None]
+        instrumentation.record_cache(not missing)
+        if missing:
+            path = storage.raw_data_paths(filename)[0]
+            names = set(feather.read_table(path, memory_map=True).schema.names)
+            missing = [column for column in missing if column in names]
+            df = read_raw_data(filename, missing)
+            for column in missing:
+                frame[column] = df[column]
+                _lru_put(_raw, (key, column), df[column], MAX_CACHED_RAW)
+    frame = {column: values for column, values in frame.items() if values is not None}
+    return pd.DataFrame(frame), key
+
+
+def load_filtered_roc(filename, column, filter_model):
+    # a column on the rows passing an AG Grid filter model (see
+    # roc_core.filter_mask) as {"rows", "data", "auc"}: the number of rows,
+    # their label_data of the column (None if it is not numeric) and the AUC
+    # (None without positives or negatives). Masks are cached per filter
+    # expression and the results per column too, so switching back to a
+    # filter is a lookup. Only the sorted class arrays are kept, the list
+    # based curve is built for the one on screen.
+    expression = json.dumps(filter_model, sort_keys=True)
+    key = dataset_key(filename)
+    result = _lru_get(_filtered, (key, column, expression))
+    if result is None:
+        df, key = load_raw_columns(
+            filename, list(dict.fromkeys([column, *filter_model, "reference_result"]))
+        )
+        mask = _lru_get(_masks, (key, expression))
+        if mask is None:
+            mask = roc_core.filter_mask(df, filter_model)
+            _lru_put(_masks, (key, expression), mask, MAX_CACHED_MASKS)
+        data = roc_core.filtered_column(df, column, mask)
+        auc = None
+        if data is not None:
+            arrays = _column_arrays(data)
+            positive, negative = arrays["positive"], arrays["negative"]
+            if positive.size and negative.size:
+                tnr, tpr, _ = roc_core.roc_arrays_from_counts(
+                    arrays["values"],
+                    arrays["acc_positive"],
+                    arrays["acc_negative"],
+                    positive.size,
+                    negative.size,
+                    # same rule as roc_core.make_roc_curve
+                    np.median(positive) <= np.median(negative),
+                )
+                auc = roc_core.roc_auc(tnr, tpr)
+        result = {"rows": int(mask.sum()), "data": data, "auc": auc}
+        _lru_put(_filtered, (key, column, expression), result, MAX_CACHED_FILTERED)
+    return result
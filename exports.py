@@ -0,0 +1,206 @@
+import os
+import tempfile
+import zlib
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import Blueprint, Response, abort, send_file, stream_with_context
+
+import reports
+import storage
+
+CHUNK_ROWS = 10_000  # rows held in memory at once while exporting
+EXCEL_MAX_ROWS = 1_048_576
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+blueprint = Blueprint("exports", __name__)
+
+
+def export_path(filename, fmt):
+    return f"/export/{fmt}/{filename}"
+
+
+def report_export_path(filename):
+    return f"/report/{filename}"
+
+
+def _relabel_chunk(chunk, start, rows, values):
+    # reference results changed in the file viewer, rows and values sorted by
+    # row and start the row of the chunk's first row
+    low, high = np.searchsorted(rows, [start, start + chunk.num_rows])
+    index = chunk.schema.get_field_index("reference_result")
+    if low == high or index < 0:
+        return chunk
+    field = chunk.schema.field(index)
+    reference = chunk.column(index).to_numpy(zero_copy_only=False).astype(float)
+    reference[rows[low:high] - start] = values[low:high]
+    return chunk.set_column(index, field, pa.array(reference).cast(field.type))
+
+
+def open_raw_data(filename):
+    # {"sources", "readers", "rows", "values"}: the upload and the appended
+    # batches memory mapped, oldest first, and the reference results changed
+    # in the file viewer. Opened under the shared lock, so they all belong to
+    # one version of the file; the maps stay readable after a newer version
+    # replaces it.
+    sources = []
+    try:
+        with storage.file_lock(filename, shared=True):
+            relabels = storage.read_relabels(filename)
+            for path in storage.raw_data_paths(filename):
+                sources.append(pa.memory_map(path))
+        readers = [pa.ipc.open_file(source) for source in sources]
+    except BaseException:
+        for source in sources:
+            source.close()
+        raise
+    rows = np.array(sorted(relabels), dtype=np.int64)
+    values = np.array([relabels[row] for row in rows], dtype=float)
+    return {"sources": sources, "readers": readers, "rows": rows, "values": values}
+
+
+def iter_raw_chunks(raw):
+    # the upload first, then the appended batches in order, only the batches
+    # being written are paged in
+    start = 0
+    try:
+        for reader in raw["readers"]:
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for offset in range(0, batch.num_rows, CHUNK_ROWS):
+                    chunk = batch.slice(offset, CHUNK_ROWS)
+                    yield _relabel_chunk(chunk, start, raw["rows"], raw["values"])
+                    start += chunk.num_rows
+    finally:
+        for source in raw["sources"]:
+            source.close()
+
+
+def raw_schema(raw):
+    return raw["readers"][0].schema
+
+
+def stream_csv_gz(raw):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    names = raw_schema(raw).names
+    header = True
+    for chunk in iter_raw_chunks(raw):
+        text = chunk.to_pandas().to_csv(index=False, header=header)
+        header = False
+        data = compressor.compress(text.encode("utf-8"))
+        if data:
+            yield data
+    if header:
+        # no rows, still write the column names
+        yield compressor.compress((",".join(names) + "\n").encode("utf-8"))
+    yield compressor.flush()
+
+
+def write_parquet(raw, out_path):
+    with pq.ParquetWriter(out_path, raw_schema(raw)) as writer:
+        for chunk in iter_raw_chunks(raw):
+            writer.write_batch(chunk)
+
+
+def write_xlsx(raw, out_path):
+    from openpyxl import Workbook
+
+    # write-only workbooks stream rows to a temporary file instead of keeping
+    # every cell in memory
+    workbook = Workbook(write_only=True)
+    names = raw_schema(raw).names
+    sheet = None
+    sheet_rows = EXCEL_MAX_ROWS
+    for chunk in iter_raw_chunks(raw):
+        columns = [chunk.column(i).to_pylist() for i in range(chunk.num_columns)]
+        for row in zip(*columns):
+            if sheet_rows >= EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+                sheet.append(names)
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet("Sheet1").append(names)
+    workbook.save(out_path)
+
+
+def _attachment_headers(download_name):
+    return {"Content-Disposition": f'attachment; filename="{download_name}"'}
+
+
+def _stream_and_remove(path):
+    try:
+        with open(path, "rb") as f:
+            while data := f.read(1024**2):
+                yield data
+    finally:
+        os.remove(path)
+
+
+def _send_temp_file(writer, raw, fmt, download_name):
+    fd, tmp_path = tempfile.mkstemp(suffix="." + fmt)
+    os.close(fd)
+    try:
+        writer(raw, tmp_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    finally:
+        # in case the writer stopped before reading every chunk
+        for source in raw["sources"]:
+            source.close()
+    headers = _attachment_headers(download_name)
+    headers["Content-Length"] = str(os.path.getsize(tmp_path))
+    return Response(
+        _stream_and_remove(tmp_path), mimetype=EXPORT_FORMATS[fmt], headers=headers
+    )
+
+
+def _check_filename(filename):
+    # only folders directly inside the data folder can be exported
+    if os.path.basename(filename) != filename or filename.startswith("."):
+        abort(404)
+
+
+@blueprint.route("/report/<path:filename>")
+def export_report(filename):
+    _check_filename(filename)
+    if reports.report_status(filename) != "ready":
+        abort(404)
+    return send_file(
+        reports.report_path(filename),
+        mimetype=EXPORT_FORMATS["xlsx"],
+        as_attachment=True,
+        download_name=os.path.splitext(filename)[0] + ".roc_report.xlsx",
+    )
+
+
+@blueprint.route("/export/<fmt>/<path:filename>")
+def export_file(fmt, filename):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    _check_filename(filename)
+    try:
+        raw = open_raw_data(filename)
+    except FileNotFoundError:
+        abort(404)
+
+    download_name = os.path.splitext(filename)[0] + "." + fmt
+    match fmt:
+        case "csv.gz":
+            return Response(
+                stream_with_context(stream_csv_gz(raw)),
+                mimetype=EXPORT_FORMATS[fmt],
+                headers=_attachment_headers(download_name),
+            )
+        case "parquet":
+            return _send_temp_file(write_parquet, raw, fmt, download_name)
+        case "xlsx":
+            return _send_temp_file(write_xlsx, raw, fmt, download_name)
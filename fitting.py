@@ -0,0 +1,299 @@
+import os
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+from scipy import optimize, stats
+
+import pools
+
+DISTRIBUTIONS = ["norm", "gompertz", "expon", "exponnorm"]
+
+# names of the fitted parameters, in the order scipy returns them
+PARAM_NAMES = {
+    "norm": ["loc", "scale"],
+    "gompertz": ["c", "loc", "scale"],
+    "expon": ["loc", "scale"],
+    "exponnorm": ["K", "loc", "scale"],
+}
+
+# budget of a single numerical fit, the best parameters so far are kept when it
+# runs out
+MAX_FIT_SECONDS = 2.0
+MAX_FIT_ITERATIONS = 1000
+
+# classes larger than this are fitted on growing quantile subsamples until the
+# parameters settle, see fit_distribution_adaptive
+SUBSAMPLE_ABOVE = 20_000
+SUBSAMPLE_START = 5_000
+SUBSAMPLE_MAX = 320_000
+SUBSAMPLE_TOLERANCE = 0.01
+
+# processes used to fit the classes of a file in parallel, 1 fits in-process
+FIT_WORKERS = int(os.environ.get("VV_FIT_WORKERS", min(os.cpu_count() or 1, 4)))
+
+# criterion used to pick the default distribution of a class, lower is better
+BEST_FIT_CRITERION = "aic"
+
+class _OutOfTime(Exception):
+    pass
+
+
+def _gompertz_quantile(p, c):
+    return np.log1p(-np.log1p(-p) / c)
+
+
+def initial_guess(dist_name, data):
+    # starting point from moments and quantiles, (shapes..., loc, scale)
+    mean = data.mean()
+    std = data.std()
+    data_min = data.min()
+    spread = np.ptp(data) or std or 1.0
+
+    if dist_name == "gompertz":
+        # support starts at loc, put it just below the smallest value
+        loc = data_min - 0.01 * spread
+        q25, q75 = np.percentile(data, [25, 75]) - loc
+        ratio = q75 / q25 if q25 > 0 else np.inf
+        # the ratio of the quartiles only depends on the shape c,
+        # it rises from 1 (c -> 0) to ln(4)/ln(4/3) (c -> inf)
+        def ratio_error(log_c):
+            c = np.exp(log_c)
+            return _gompertz_quantile(0.75, c) / _gompertz_quantile(0.25, c) - ratio
+
+        low, high = -20.0, 20.0
+        if not np.isfinite(ratio) or ratio_error(high) <= 0:
+            c = np.exp(high)
+        elif ratio_error(low) >= 0:
+            c = np.exp(low)
+        else:
+            c = np.exp(optimize.brentq(ratio_error, low, high))
+        scale = q75 / _gompertz_quantile(0.75, c) if q75 > 0 else spread
+        return (c, loc, scale)
+
+    if dist_name == "exponnorm":
+        # mean = mu + sigma*K, var = sigma^2 (1 + K^2), skew = 2 K^3 / (1 + K^2)^1.5
+        skew = stats.skew(data) if std > 0 else 0.0
+        t = np.clip(skew / 2, 0.01, 0.99) ** (2 / 3)
+        K = np.sqrt(t / (1 - t))
+        scale = std / np.sqrt(1 + K**2) if std > 0 else 1.0
+        return (K, mean - scale * K, scale)
+
+    raise ValueError(f"no initial guess for {dist_name}")
+
+
+def _bounded_optimizer(info, max_seconds, max_iterations):
+    def optimizer(func, x0, args=(), disp=0):
+        deadline = time.perf_counter() + max_seconds
+        best = {"x": np.asarray(x0, dtype=float), "iterations": 0}
+
+        def callback(xk):
+            best["x"] = np.array(xk)
+            best["iterations"] += 1
+            if time.perf_counter() > deadline:
+                raise _OutOfTime
+
+        try:
+            xopt, _, iterations, _, warnflag = optimize.fmin(
+                func,
+                x0,
+                args=args,
+                disp=0,
+                maxiter=max_iterations,
+                maxfun=max_iterations * 2,
+                full_output=True,
+                callback=callback,
+            )
+        except _OutOfTime:
+            info["status"] = "time limit"
+            info["iterations"] = best["iterations"]
+            return best["x"]
+        info["status"] = "converged" if warnflag == 0 else "iteration limit"
+        info["iterations"] = int(iterations)
+        return xopt
+
+    return optimizer
+
+
+def fit_distribution(
+    dist_name,
+    data,
+    max_seconds=MAX_FIT_SECONDS,
+    max_iterations=MAX_FIT_ITERATIONS,
+    guess=None,
+):
+    # returns ({param name: value}, {"status", "iterations", "seconds",
+    # "sample_size"})
+    start = time.perf_counter()
+    info = {"status": "closed form", "iterations": 0, "sample_size": int(data.size)}
+
+    if dist_name == "norm":
+        values = (data.mean(), data.std())
+    elif dist_name == "expon":
+        values = (data.min(), data.mean() - data.min())
+    else:
+        dist = getattr(stats, dist_name)
+        if guess is None:
+            guess = initial_guess(dist_name, data)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                optimizer = _bounded_optimizer(info, max_seconds, max_iterations)
+                values = dist.fit(
+                    data,
+                    *guess[:-2],
+                    loc=guess[-2],
+                    scale=guess[-1],
+                    optimizer=optimizer,
+                )
+                # degenerate data (e.g. nearly all values tied) can leave the
+                # warm start outside the support, retry from scipy's own start
+                if not np.isfinite(dist.nnlf(values, data)):
+                    values = dist.fit(data, optimizer=optimizer)
+                    info["status"] += " (default start)"
+        except Exception as e:
+            # keep the moment estimates rather than failing the whole file
+            info["status"] = f"failed: {e}"
+            values = guess
+
+    params = {
+        name: float(value) for name, value in zip(PARAM_NAMES[dist_name], values)
+    }
+    info["seconds"] = time.perf_counter() - start
+    return params, info
+
+
+def goodness_of_fit(dist_name, params, data):
+    # data must be sorted, as it is in labeled_data
+    n = data.size
+    dist = getattr(stats, dist_name)(**params)
+    k = len(params)
+    with np.errstate(all="ignore"):
+        log_likelihood = float(dist.logpdf(data).sum())
+        cdf = dist.cdf(data)
+    # Kolmogorov-Smirnov statistic against the empirical cdf
+    ks = float(
+        max(
+            (np.arange(1, n + 1) / n - cdf).max(),
+            (cdf - np.arange(n) / n).max(),
+        )
+    )
+    return {
+        "log_likelihood": log_likelihood,
+        "aic": 2 * k - 2 * log_likelihood,
+        "bic": k * np.log(n) - 2 * log_likelihood,
+        "ks": ks,
+    }
+
+
+def quantile_subsample(sorted_data, size):
+    # evenly spaced order statistics keep every quantile of the class
+    index = np.linspace(0, sorted_data.size - 1, size).round().astype(int)
+    return sorted_data[index]
+
+
+def _param_change(params, previous, std):
+    # location and scale relative to the spread of the data, shapes to themselves
+    change = 0.0
+    for name, value in params.items():
+        if name in ("loc", "scale"):
+            reference = std
+        else:
+            reference = max(abs(previous[name]), 1e-6)
+        change = max(change, abs(value - previous[name]) / (reference or 1.0))
+    return change
+
+
+def fit_distribution_adaptive(
+    dist_name,
+    sorted_data,
+    tolerance=SUBSAMPLE_TOLERANCE,
+):
+    # fit large classes on quantile subsamples that double in size until the
+    # parameters change less than the tolerance, closed form fits use all data
+    n = sorted_data.size
+    if n <= SUBSAMPLE_ABOVE or dist_name in ("norm", "expon"):
+        return fit_distribution(dist_name, sorted_data)
+
+    std = sorted_data.std()
+    size = SUBSAMPLE_START
+    params, info = None, None
+    seconds = 0.0
+    while True:
+        previous = params
+        guess = tuple(params.values()) if params else None
+        params, info = fit_distribution(
+            dist_name, quantile_subsample(sorted_data, size), guess=guess
+        )
+        seconds += info["seconds"]
+        if previous and _param_change(params, previous, std) < tolerance:
+            break
+        if size >= min(n, SUBSAMPLE_MAX):
+            info["status"] += " (subsample limit)"
+            break
+        size = min(size * 2, n, SUBSAMPLE_MAX)
+    info["seconds"] = seconds
+    return params, info
+
+
+def fit_class(data):
+    # fit and score every distribution on the data of one class
+    fits = {}
+    for dist_name in DISTRIBUTIONS:
+        params, info = fit_distribution_adaptive(dist_name, data)
+        fits[dist_name] = {
+            "params": params,
+            "info": info,
+            "scores": goodness_of_fit(dist_name, params, data),
+        }
+    return fits
+
+
+def best_fit(fits, criterion=BEST_FIT_CRITERION):
+    scores = {
+        dist_name: fit["scores"][criterion]
+        for dist_name, fit in fits.items()
+        if fit["scores"] and np.isfinite(fit["scores"][criterion])
+    }
+    if not scores:
+        return None
+    return min(scores, key=scores.get)
+
+
+def fit_class_profiled(data, trace_memory=True):
+    # (fit_class(data), {"wall_s", "cpu_s", "peak_mb"}) measured in the process
+    # running the fit, a pool worker where nothing else is traced
+    if trace_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        fits = fit_class(data)
+        stats = {
+            "wall_s": time.perf_counter() - wall_start,
+            "cpu_s": time.process_time() - cpu_start,
+            "peak_mb": None,
+        }
+        if trace_memory:
+            stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return fits, stats
+
+
+def fit_classes(
+    class_arrays, max_workers=FIT_WORKERS, profile=False, trace_memory=True
+):
+    # {key: sorted array} -> {key: fit_class(array)}, in parallel when there is
+    # more than one class to fit. With profile {key: fit_class_profiled(array)},
+    # always in worker processes so every fit is measured on its own.
+    keys = [key for key, data in class_arrays.items() if data.size > 0]
+    if profile and keys:
+        tasks = [(fit_class_profiled, class_arrays[key], trace_memory) for key in keys]
+        return dict(zip(keys, pools.run("fit", max(max_workers, 1), tasks)))
+    if max_workers > 1 and len(keys) > 1:
+        tasks = [(fit_class, class_arrays[key]) for key in keys]
+        return dict(zip(keys, pools.run("fit", max_workers, tasks)))
+    return {key: fit_class(class_arrays[key]) for key in keys}
@@ -0,0 +1,19 @@
+import os
+
+bind = os.environ.get("VV_BIND", "0.0.0.0:8050")
+
+# processes handle uploads and plots in parallel, threads keep a worker
+# responsive while one of its callbacks waits on a long processing job
+workers = int(os.environ.get("VV_WORKERS", min(os.cpu_count() or 1, 4)))
+threads = int(os.environ.get("VV_THREADS", 4))
+worker_class = "gthread"
+
+# the app is imported once by the master process, a new or restarted worker is
+# forked from it instead of importing dash, pandas and plotly again
+preload_app = os.environ.get("VV_PRELOAD", "1") != "0"
+
+# processing a large upload and its parameter fits can take minutes
+timeout = int(os.environ.get("VV_TIMEOUT", 600))
+graceful_timeout = 30
+
+accesslog = os.environ.get("VV_ACCESS_LOG")
@@ -0,0 +1,85 @@
+import functools
+import io
+
+import pandas as pd
+
+# Reading uploaded tables. Like roc_core, only pandas is imported here and no
+# other module of the app, so the command line tool can use it too.
+
+# extension: (reader, compression), compressed text is decompressed on the fly
+FORMATS = {
+    ".tsv": ("tsv", None),
+    ".tsv.gz": ("tsv", "gzip"),
+    ".csv": ("csv", None),
+    ".csv.gz": ("csv", "gzip"),
+    ".parquet": ("parquet", None),
+    ".xlsx": ("excel", None),
+}
+
+SEPARATORS = {"tsv": "\t", "csv": ","}
+
+
+@functools.cache
+def csv_engine():
+    # multithreaded parsing with pyarrow, the default C engine without it.
+    # Looked up on the first read, pyarrow.csv is too slow to import at startup.
+    try:
+        import pyarrow.csv  # noqa: F401
+    except ImportError:
+        return "c"
+    return "pyarrow"
+
+
+def file_format(filename):
+    # (reader, compression) of a supported file name, None otherwise
+    name = filename.lower()
+    # longest first, so .tsv.gz is not taken for .gz
+    for extension in sorted(FORMATS, key=len, reverse=True):
+        if name.endswith(extension):
+            return FORMATS[extension]
+    return None
+
+
+def strip_extension(filename):
+    name = filename.lower()
+    for extension in sorted(FORMATS, key=len, reverse=True):
+        if name.endswith(extension):
+            return filename[: -len(extension)]
+    return filename
+
+
+def supported_extensions():
+    return ", ".join(FORMATS)
+
+
+def read_table(source, filename=None):
+    # source is a path or the bytes of an upload, the format comes from filename
+    # (or the path). Raises ValueError for unsupported files and
+    # pd.errors.EmptyDataError for empty ones.
+    filename = filename or source
+    fmt = file_format(filename)
+    if fmt is None:
+        raise ValueError(f"unsupported file type: {filename}")
+    reader, compression = fmt
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    if reader == "parquet":
+        return pd.read_parquet(source)
+    if reader == "excel":
+        # first sheet only, like a single tsv
+        return pd.read_excel(source, sheet_name=0)
+
+    engine = csv_engine()
+    try:
+        return pd.read_csv(
+            source,
+            sep=SEPARATORS[reader],
+            compression=compression,
+            engine=engine,
+        )
+    except Exception as e:
+        # pyarrow reports an empty file as an ArrowInvalid
+        if engine == "pyarrow" and "Empty CSV file" in str(e):
+            raise pd.errors.EmptyDataError(str(e)) from e
+        raise
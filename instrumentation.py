@@ -0,0 +1,268 @@
+import contextlib
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+import numpy as np
+from dash.exceptions import PreventUpdate
+from plotly.utils import PlotlyJSONEncoder
+
+# Opt-in: set VV_INSTRUMENT=1 to time callbacks and measure their payloads.
+# VV_INSTRUMENT_LOG=path writes the rolling summary to a rotating log file
+# instead of stderr, VV_INSTRUMENT_SUMMARY sets how many calls between summaries.
+ENABLED = os.environ.get("VV_INSTRUMENT", "") not in ("", "0")
+LOG_FILE = os.environ.get("VV_INSTRUMENT_LOG")
+SUMMARY_EVERY = int(os.environ.get("VV_INSTRUMENT_SUMMARY", 50))
+WINDOW = 500  # calls kept per callback for the percentiles
+
+METRICS_PATH = "/_metrics"
+
+logger = logging.getLogger("validation_visualizer.instrumentation")
+
+_lock = threading.Lock()
+_calls = defaultdict(lambda: deque(maxlen=WINDOW))
+_totals = defaultdict(
+    lambda: {
+        "calls": 0,
+        "prevented": 0,
+        "errors": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+    }
+)
+_calls_since_summary = 0
+_local = threading.local()
+
+
+class _SizeEncoder(PlotlyJSONEncoder):
+    # no_update and other dash sentinels are not serialized by dash either
+    def default(self, obj):
+        try:
+            return super().default(obj)
+        except TypeError:
+            return None
+
+
+def payload_size(value):
+    try:
+        return len(json.dumps(value, cls=_SizeEncoder))
+    except (TypeError, ValueError):
+        return 0
+
+
+def record_cache(hit):
+    counts = getattr(_local, "cache", None)
+    if counts is None:
+        return
+    if hit:
+        counts["hits"] += 1
+    else:
+        counts["misses"] += 1
+
+
+def instrument(func):
+    if not ENABLED:
+        return func
+
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _local.cache = {"hits": 0, "misses": 0}
+        status = "ok"
+        result = None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except PreventUpdate:
+            status = "prevented"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            cache = _local.cache
+            _local.cache = None
+            _record(
+                name,
+                {
+                    "wall": wall,
+                    "input_bytes": payload_size([args, kwargs]),
+                    "output_bytes": payload_size(result),
+                    "status": status,
+                    "cache_hits": cache["hits"],
+                    "cache_misses": cache["misses"],
+                },
+            )
+
+    return wrapper
+
+
+def _record(name, call):
+    global _calls_since_summary
+    with _lock:
+        _calls[name].append(call)
+        totals = _totals[name]
+        totals["calls"] += 1
+        if call["status"] == "prevented":
+            totals["prevented"] += 1
+        elif call["status"] == "error":
+            totals["errors"] += 1
+        totals["cache_hits"] += call["cache_hits"]
+        totals["cache_misses"] += call["cache_misses"]
+
+        _calls_since_summary += 1
+        log_now = _calls_since_summary >= SUMMARY_EVERY
+        if log_now:
+            _calls_since_summary = 0
+
+    if log_now:
+        log_summary()
+
+
+def summary():
+    with _lock:
+        calls = {name: list(window) for name, window in _calls.items()}
+        totals = {name: dict(t) for name, t in _totals.items()}
+
+    out = {}
+    for name, window in calls.items():
+        wall_ms = np.array([c["wall"] for c in window]) * 1000
+        input_kb = np.array([c["input_bytes"] for c in window]) / 1024
+        output_kb = np.array([c["output_bytes"] for c in window]) / 1024
+        out[name] = {
+            **totals[name],
+            "window": len(window),
+            "wall_ms_p50": float(np.percentile(wall_ms, 50)),
+            "wall_ms_p95": float(np.percentile(wall_ms, 95)),
+            "wall_ms_max": float(wall_ms.max()),
+            "input_kb_mean": float(input_kb.mean()),
+            "input_kb_max": float(input_kb.max()),
+            "output_kb_mean": float(output_kb.mean()),
+            "output_kb_max": float(output_kb.max()),
+        }
+    return out
+
+
+def log_summary():
+    for name, s in sorted(summary().items(), key=lambda kv: -kv[1]["wall_ms_p95"]):
+        logger.info(
+            "%s: calls=%d p50=%.1fms p95=%.1fms max=%.1fms in=%.1fKB out=%.1fKB "
+            "(max in=%.1fKB out=%.1fKB) cache=%d/%d prevented=%d errors=%d",
+            name,
+            s["calls"],
+            s["wall_ms_p50"],
+            s["wall_ms_p95"],
+            s["wall_ms_max"],
+            s["input_kb_mean"],
+            s["output_kb_mean"],
+            s["input_kb_max"],
+            s["output_kb_max"],
+            s["cache_hits"],
+            s["cache_hits"] + s["cache_misses"],
+            s["prevented"],
+            s["errors"],
+        )
+
+
+def init_app(server):
+    if not ENABLED:
+        return
+
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        if LOG_FILE:
+            handler = logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=1024**2, backupCount=3
+            )
+        else:
+            handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+
+    from flask import abort, jsonify, request
+
+    @server.route(METRICS_PATH)
+    def metrics():
+        # only reachable from the machine running the server
+        if request.remote_addr not in ("127.0.0.1", "::1"):
+            abort(403)
+        return jsonify({"pid": os.getpid(), "callbacks": summary()})
+
+
+class StageProfiler:
+    # Wall time, CPU time and peak traced memory of the stages of a job.
+    # Stages can be nested, a parent's peak includes the peaks of its children.
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._stack = []
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _peak(self):
+        if not tracemalloc.is_tracing():
+            return 0, 0
+        return tracemalloc.get_traced_memory()
+
+    @contextlib.contextmanager
+    def stage(self, name, column=None):
+        current, peak = self._peak()
+        if self._stack:
+            # keep the parent's peak before resetting it for the child
+            parent = self._stack[-1]
+            parent["peak"] = max(parent["peak"], peak)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+        # appended on entry so stages are listed in the order they started
+        record = {"stage": name, "column": column, "depth": len(self._stack)}
+        self.stages.append(record)
+        entry = {"start_memory": current, "peak": current}
+        self._stack.append(entry)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+            _, peak = self._peak()
+            peak = max(entry["peak"], peak)
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            record["wall_s"] = round(wall, 6)
+            record["cpu_s"] = round(cpu, 6)
+            record["peak_mb"] = round((peak - entry["start_memory"]) / 1024**2, 3)
+
+    def record(self, name, column=None, wall_s=None, cpu_s=None, peak_mb=None):
+        # a stage timed elsewhere, e.g. in a worker process
+        self.stages.append(
+            {
+                "stage": name,
+                "column": column,
+                "depth": len(self._stack),
+                "wall_s": wall_s,
+                "cpu_s": cpu_s,
+                "peak_mb": peak_mb,
+            }
+        )
@@ -32,6 +32,13 @@ positive_buttons = html.Div(
                     color="danger",
                     outline=False,
                 ),
+                dbc.Button(
+                    "KDE",
+                    id="pos-btn-4",
+                    n_clicks=0,
+                    color="danger",
+                    outline=True,
+                ),
             ],
             id="pos-btn-group",
             class_name="btn-group-sm",
@@ -74,6 +81,13 @@ negative_buttons = html.Div(
                     color="primary",
                     outline=False,
                 ),
+                dbc.Button(
+                    "KDE",
+                    id="neg-btn-4",
+                    n_clicks=0,
+                    color="primary",
+                    outline=True,
+                ),
             ],
             id="neg-btn-group",
             class_name="btn-group-sm",
@@ -120,6 +134,13 @@ unknown_buttons = html.Div(
                     color="secondary",
                     outline=False,
                 ),
+                dbc.Button(
+                    "KDE",
+                    id="unk-btn-4",
+                    n_clicks=0,
+                    color="secondary",
+                    outline=True,
+                ),
             ],
             id="unk-btn-group",
             class_name="btn-group-sm",
@@ -347,6 +368,18 @@ layout = dbc.Container(
                                                 dbc.Tab(
                                                     label="ROC Curve",
                                                     children=[
+                                                        dbc.Checklist(
+                                                            options=[
+                                                                {
+                                                                    "label": "95% CI (bootstrap)",
+                                                                    "value": 1,
+                                                                }
+                                                            ],
+                                                            value=[],
+                                                            id="bootstrap-ci",
+                                                            switch=True,
+                                                            className="mt-2",
+                                                        ),
                                                         dcc.Graph(
                                                             id="roc_plot",
                                                             # style={"height": "525px"},
@@ -357,6 +390,35 @@ layout = dbc.Container(
                                                         )  # Set height for plot
                                                     ],
                                                 ),
+                                                dbc.Tab(
+                                                    label="Compare",
+                                                    children=[
+                                                        dcc.Dropdown(
+                                                            placeholder="Select Columns to Compare",
+                                                            multi=True,
+                                                            id="compare-columns-select",
+                                                            className="mt-2",
+                                                        ),
+                                                        dcc.Graph(
+                                                            id="compare-roc-plot",
+                                                            config={
+                                                                "doubleClick": False,
+                                                                "displayModeBar": False,
+                                                            },
+                                                        ),
+                                                        dash_table.DataTable(
+                                                            id="compare-delong-table",
+                                                            columns=[],
+                                                            data=[],
+                                                            style_table={
+                                                                "overflowX": "auto",
+                                                            },
+                                                            style_cell={
+                                                                "fontSize": "12px",
+                                                            },
+                                                        ),
+                                                    ],
+                                                ),
                                                 dbc.Tab(
                                                     label="File Viewer",
                                                     children=[
@@ -18,17 +18,13 @@ from dash import (
 import pandas as pd
 import json
 import os
-import shutil
+from urllib.parse import quote
 
-
-SAVED_FILE_NAMES = {
-    "roc curves": "roc_curves.pkl",
-    "raw data": "raw_data.feather",
-    "labeled data": "labeled_data.pkl",
-    "parameter fitting": "fitted_params.pkl",
-}
-
-DATA_FOLDER = "data"
+import datastore
+import exports
+import reports
+import storage
+from storage import DATA_FOLDER, OPTIONAL_FILE_NAMES
 
 
 dash.register_page(
@@ -40,7 +36,8 @@ dash.register_page(
 layout = dbc.Container(
     children=[
         dcc.Store(id="manage-files-button-click", data={}),
-        dcc.Download(id="download-xlsx"),
+        dcc.Store(id="report-jobs", data=[]),
+        dcc.Interval(id="report-poll", interval=2000, disabled=True),
         dbc.Col(
             dcc.Upload(
                 id="upload-data",
@@ -62,6 +59,61 @@ layout = dbc.Container(
             ),
             width=12,
         ),
+        dbc.Row(
+            [
+                dbc.Col(html.Label("Append rows to:", htmlFor="append-target"), width="auto"),
+                dbc.Col(
+                    dbc.Select(id="append-target", options=[], size="sm"),
+                    width=3,
+                ),
+                dbc.Col(
+                    dbc.Checkbox(id="append-refit", label="Refit distributions", value=False),
+                    width="auto",
+                ),
+                dbc.Col(
+                    dcc.Upload(
+                        id="append-data",
+                        multiple=False,
+                        children=html.Div([
+                            "Drag and Drop or ",
+                            html.A("Select a File to append", className="navlink")
+                        ]),
+                        style={
+                            'width': '100%',
+                            'height': '35px',
+                            'lineHeight': '35px',
+                            'borderWidth': '1px',
+                            'borderStyle': 'dashed',
+                            'borderRadius': '5px',
+                            'textAlign': 'center'
+                        },
+                    ),
+                ),
+            ],
+            align="center",
+            class_name="mb-2",
+        ),
+        dbc.Row(
+            [
+                dbc.Col(html.Label("Download as:", htmlFor="download-format"), width="auto"),
+                dbc.Col(
+                    dbc.Select(
+                        id="download-format",
+                        options=[
+                            {"label": "Excel (.xlsx)", "value": "xlsx"},
+                            {"label": "Compressed CSV (.csv.gz)", "value": "csv.gz"},
+                            {"label": "Parquet (.parquet)", "value": "parquet"},
+                        ],
+                        value="xlsx",
+                        size="sm",
+                    ),
+                    width=3,
+                ),
+            ],
+            align="center",
+            class_name="mb-2",
+        ),
+        html.Div(id="report-status", className="mb-2"),
         dbc.Row(
             [
                 dbc.Col(
@@ -85,10 +137,20 @@ layout = dbc.Container(
                              "cellRenderer": "Button",
                              "cellRendererParams": {"className": "btn btn-info btn-sm"},
                              },
+                            {"field": "profile",
+                             "width": 90,
+                             "cellRenderer": "Button",
+                             "cellRendererParams": {"className": "btn btn-secondary btn-sm"},
+                             },
                             {"field": "download",
                              "width": 110,
+                             "cellRenderer": "Link",
+                             "cellRendererParams": {"className": "btn btn-success btn-sm", "label": "Download"},
+                             },
+                            {"field": "report",
+                             "width": 90,
                              "cellRenderer": "Button",
-                             "cellRendererParams": {"className": "btn btn-success btn-sm"},
+                             "cellRendererParams": {"className": "btn btn-primary btn-sm"},
                              },
                             {"field": "delete",
                              "width": 85,
@@ -125,18 +187,37 @@ layout = dbc.Container(
 @callback(
         Output("manage-files", "rowData"),
         Input("processed-files-list", "data"),
+        Input("download-format", "value"),
 )
-def add_files_to_grid(files):
+def add_files_to_grid(files, download_format):
     data = {
         "filename": files,
         "view": ["View" for f in files],
-        "download": ["Download" for f in files],
+        "profile": ["Profile" for f in files],
+        "download": [
+            dash.get_relative_path(exports.export_path(quote(f), download_format))
+            for f in files
+        ],
+        "report": ["Report" for f in files],
         "delete": ["Delete" for f in files],
     }
     df = pd.DataFrame(data)
     return df.to_dict("records")
 
 
+@callback(
+        Output("append-target", "options"),
+        Output("append-target", "value"),
+        Input("processed-files-list", "data"),
+        State("append-target", "value"),
+)
+def update_append_target(files, target):
+    files = files or []
+    if target not in files:
+        target = files[-1] if files else None
+    return [{"label": f, "value": f} for f in files], target
+
+
 @callback(
     Output("manage-files-button-click", "data"),
     Input("manage-files", "cellRendererData"),
@@ -150,7 +231,6 @@ def save_row_data(n):
 @callback(
         Output("file-viewer", "columnDefs"),
         Output("file-viewer", "rowData"),
-        Output("download-xlsx", "data"),
         Output("processed-files-list", "data", allow_duplicate=True),
         Input("manage-files-button-click", "data"),
         State("manage-files", "rowData"),
@@ -161,15 +241,14 @@ def button_manager(button_data, row_data, processed_files):
     row      = button_data["rowIndex"]
     action   = button_data["colId"]
     filename = row_data[row]["filename"]
-    filepath = os.path.join(DATA_FOLDER, filename, SAVED_FILE_NAMES["raw data"])
 
     out_columnDefs = None
     out_rowData = None
-    out_download = None
 
     match action:
         case "view":
-            df = pd.read_feather(filepath)
+            with storage.file_lock(filename, shared=True):
+                df = datastore.read_raw_data(filename)
             out_rowData=df.to_dict("records")
             out_columnDefs=[
                         {
@@ -177,14 +256,108 @@ def button_manager(button_data, row_data, processed_files):
                             "children" : [{"field": i} for i in df.columns]
                         }
                     ]
-        case "download":
-            df = pd.read_feather(filepath)
-            out_download = dcc.send_data_frame(df.to_excel, filename, sheet_name="Sheet1")
+        case "profile":
+            profile_path = os.path.join(
+                DATA_FOLDER, filename, OPTIONAL_FILE_NAMES["processing profile"]
+            )
+            stage_columns = ["stage", "column", "wall_s", "cpu_s", "peak_mb"]
+            if os.path.exists(profile_path):
+                with open(profile_path) as f:
+                    profile = json.load(f)
+                header = f"{filename} ({profile['rows']} rows, {profile['columns']} columns)"
+                out_rowData = [
+                    {
+                        **stage,
+                        "stage": "\u2003" * stage["depth"] + stage["stage"],
+                    }
+                    for stage in profile["stages"]
+                ]
+            else:
+                header = f"{filename} (no processing profile)"
+                out_rowData = []
+            out_columnDefs = [
+                {
+                    "headerName": header,
+                    "children": [{"field": i} for i in stage_columns],
+                }
+            ]
+        case "report":
+            # handled by start_report_job, keep the viewer as it is
+            raise dash.exceptions.PreventUpdate
         case "delete":
             processed_files.remove(filename)
-            shutil.rmtree(os.path.join(DATA_FOLDER, filename))
+            # moved out of the way first, so no reader sees a half deleted folder
+            storage.remove_dataset(filename)
+
+    return out_columnDefs, out_rowData, processed_files
+
+@callback(
+    Output("report-jobs", "data"),
+    Output("report-poll", "disabled"),
+    Input("manage-files-button-click", "data"),
+    State("manage-files", "rowData"),
+    State("report-jobs", "data"),
+    prevent_initial_call=True,
+)
+def start_report_job(button_data, row_data, report_jobs):
+    if button_data.get("colId") != "report":
+        return no_update, no_update
+    filename = row_data[button_data["rowIndex"]]["filename"]
+    reports.start_report(filename)
+    if filename not in report_jobs:
+        report_jobs = report_jobs + [filename]
+    return report_jobs, False
+
+
+@callback(
+    Output("report-status", "children"),
+    Output("report-poll", "disabled", allow_duplicate=True),
+    Input("report-poll", "n_intervals"),
+    Input("report-jobs", "data"),
+    State("processed-files-list", "data"),
+    prevent_initial_call=True,
+)
+def poll_report_jobs(n_intervals, report_jobs, processed_files):
+    messages = []
+    running = False
+    for filename in report_jobs:
+        if filename not in (processed_files or []):
+            continue
+        status = reports.report_status(filename)
+        if status == "running":
+            running = True
+            messages.append(
+                html.Div([dbc.Spinner(size="sm"), f" Writing ROC report for {filename}"])
+            )
+        elif status == "ready":
+            messages.append(
+                html.Div(
+                    [
+                        "ROC report for ",
+                        html.A(
+                            filename,
+                            href=dash.get_relative_path(
+                                exports.report_export_path(quote(filename))
+                            ),
+                            download="",
+                        ),
+                        " is ready.",
+                    ]
+                )
+            )
+        elif status == "failed":
+            # the last line of the traceback names the exception
+            lines = reports.report_error(filename).strip().splitlines()
+            messages.append(
+                dbc.Alert(
+                    f"ROC report for {filename} failed: "
+                    + (lines[-1] if lines else "unknown error"),
+                    color="danger",
+                    className="py-1 mb-1",
+                )
+            )
+    return messages, not running
 
-    return out_columnDefs, out_rowData, out_download, processed_files
 
 @callback(
     Output('file-viewer', 'columnSize'),
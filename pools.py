@@ -0,0 +1,60 @@
+import threading
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker pools are kept for the life of the server process, one per name. A
+# pool whose worker died (killed, out of memory) refuses every later task, so
+# it is dropped and the tasks are sent once more to a new pool.
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def _init_worker():
+    # forked workers inherit memory tracing from a profiled upload
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def get_executor(name, max_workers):
+    with _lock:
+        executor = _executors.get(name)
+        if executor is None or executor._max_workers != max_workers:
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_worker
+            )
+            _executors[name] = executor
+        return executor
+
+
+def _drop(name, executor):
+    with _lock:
+        if _executors.get(name) is executor:
+            del _executors[name]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run(name, max_workers, tasks):
+    # [(fn, *args)] -> [fn(*args)] computed in the pool, in order
+    for attempt in range(2):
+        executor = get_executor(name, max_workers)
+        try:
+            futures = [executor.submit(*task) for task in tasks]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            _drop(name, executor)
+            if attempt:
+                raise
+
+
+def submit(name, max_workers, fn, *args):
+    # starts fn(*args) in the pool without waiting for it
+    for attempt in range(2):
+        executor = get_executor(name, max_workers)
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            _drop(name, executor)
+            if attempt:
+                raise
@@ -0,0 +1,186 @@
+import json
+import os
+import pickle
+import re
+import socket
+import time
+import traceback
+
+import pools
+import storage
+from storage import DATA_FOLDER, SAVED_FILE_NAMES
+
+REPORT_FILE_NAME = "roc_report.xlsx"
+# sentinel of a running job, hidden so a folder that is being written to is not
+# mistaken for processed data
+PARTIAL_FILE_NAME = ".roc_report.xlsx.partial"
+ERROR_FILE_NAME = ".roc_report.error"
+
+# a job whose process is gone, or that has run for longer than this, is taken
+# for dead and the report can be started again
+REPORT_TIMEOUT = float(os.environ.get("VV_REPORT_TIMEOUT", 60 * 60))
+
+def _paths(filename):
+    file_dir = os.path.join(DATA_FOLDER, filename)
+    return (
+        os.path.join(file_dir, SAVED_FILE_NAMES["roc curves"]),
+        os.path.join(file_dir, REPORT_FILE_NAME),
+        os.path.join(file_dir, PARTIAL_FILE_NAME),
+        os.path.join(file_dir, ERROR_FILE_NAME),
+    )
+
+
+def report_path(filename):
+    return _paths(filename)[1]
+
+
+def _write_owner(partial):
+    # the sentinel names the process running the job
+    owner = {"pid": os.getpid(), "host": socket.gethostname(), "started": time.time()}
+    storage.write_atomic(partial, lambda f: f.write(json.dumps(owner).encode()))
+
+
+def _read_owner(partial):
+    try:
+        with open(partial) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        # no job, or an empty sentinel of an older version
+        return None
+
+
+def _is_running(partial):
+    # a sentinel of a killed worker or server stays behind, it only counts
+    # while its process lives (when on this host) and for REPORT_TIMEOUT
+    owner = _read_owner(partial)
+    if owner is None:
+        return False
+    if time.time() - owner.get("started", 0) > REPORT_TIMEOUT:
+        return False
+    if owner.get("host") == socket.gethostname():
+        try:
+            os.kill(owner["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+def report_status(filename):
+    roc_path, report, partial, error = _paths(filename)
+    if _is_running(partial):
+        return "running"
+    if os.path.exists(error):
+        return "failed"
+    # a report older than the processed data belongs to a previous upload
+    if os.path.exists(report) and os.path.getmtime(report) >= os.path.getmtime(
+        roc_path
+    ):
+        return "ready"
+    return "missing"
+
+
+def report_error(filename):
+    # traceback of a failed job, empty if it was removed meanwhile (a new
+    # job was started)
+    try:
+        with open(_paths(filename)[3]) as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def sheet_title(column, used):
+    # excel sheet names: max 31 characters, none of []:*?/\ and unique
+    title = re.sub(r"[\[\]:*?/\\]", "_", str(column))[:31] or "column"
+    base, n = title, 1
+    while title.lower() in used:
+        n += 1
+        suffix = f" ({n})"
+        title = base[: 31 - len(suffix)] + suffix
+    used.add(title.lower())
+    return title
+
+
+def write_report(filename):
+    # imported here so the worker process only loads them when it runs
+    from openpyxl import Workbook
+    from roc_core import roc_arrays, roc_auc, roc_table
+
+    roc_path, report, partial, error = _paths(filename)
+    with open(roc_path, "rb") as f:
+        roc_curves = pickle.load(f)
+
+    workbook = Workbook(write_only=True)
+    summary = workbook.create_sheet("Summary")
+    summary.append(
+        [
+            "column",
+            "sheet",
+            "total positive",
+            "total negative",
+            "total unknown",
+            "mirrored",
+            "AUC",
+            "table rows",
+        ]
+    )
+    used_titles = {"summary"}
+
+    for column, roc_data in roc_curves.items():
+        title = sheet_title(column, used_titles)
+        row = [
+            column,
+            title,
+            roc_data["total_positive"],
+            roc_data["total_negative"],
+            roc_data["total_unknown"],
+            bool(roc_data["mirrored"]),
+            None,
+            0,
+        ]
+        sheet = workbook.create_sheet(title)
+        sheet.append(["TNR(x)", "TPR(y)", "threshold"])
+        if roc_data["total_positive"] and roc_data["total_negative"]:
+            # same table as the command line tool
+            df_roc = roc_table(roc_data)
+            for values in df_roc.itertuples(index=False):
+                sheet.append([float(v) for v in values])
+            row[6] = roc_auc(*roc_arrays(roc_data)[:2])
+            row[7] = len(df_roc)
+        summary.append(row)
+
+    storage.write_atomic(report, workbook.save)
+
+
+def _run(filename):
+    _, _, partial, error = _paths(filename)
+    try:
+        # from now on the job lives as long as this worker
+        _write_owner(partial)
+        # a new upload of the file is published once the report is written
+        with storage.file_lock(filename, shared=True):
+            write_report(filename)
+    except Exception:
+        with open(error, "w") as f:
+            f.write(traceback.format_exc())
+    finally:
+        # unless a new job took over after this one timed out
+        owner = _read_owner(partial)
+        if owner and owner.get("pid") == os.getpid():
+            os.remove(partial)
+
+
+def start_report(filename):
+    roc_path, report, partial, error = _paths(filename)
+    # only one server process may start the job
+    with storage.file_lock(filename + ".report"):
+        if report_status(filename) in ("running", "ready"):
+            return
+        if os.path.exists(error):
+            os.remove(error)
+        # marks the job as running for every server process until it is done,
+        # a stale sentinel is replaced
+        _write_owner(partial)
+    pools.submit("report", 1, _run, filename)
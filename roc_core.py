@@ -0,0 +1,870 @@
+import bisect
+import math
+
+import numpy as np
+import pandas as pd
+
+# ROC and metrics math without plotting or dash, shared by the app, the command
+# line tool and background jobs. Only numpy and pandas are imported here and no
+# other module of the app, so it also works inside the package (__main__.py).
+
+# bins of the distribution histograms, whatever the zoom
+MAX_HISTOGRAM_BINS = 400
+
+# points of a kernel density estimate, over the whole class
+KDE_GRID_SIZE = 1024
+
+# np.trapz was renamed in numpy 2
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def label_data(df):
+    labeled_data = {}
+    numeric_cols = [
+        col
+        for col in df.columns
+        if pd.api.types.is_numeric_dtype(df[col]) and col != "reference_result"
+    ]
+
+    for col in numeric_cols:
+
+        # Filter data based on reference_result
+        if "reference_result" in df.columns:
+            df["reference_result"] = df["reference_result"].fillna(0)
+            positive_data_filtered = df[df["reference_result"] > 0][col].to_numpy()
+            negative_data_filtered = df[df["reference_result"] < 0][col].to_numpy()
+            unknown_data_filtered = df[df["reference_result"] == 0][col].to_numpy()
+        else:
+            unknown_data_filtered = df[col].to_numpy()
+            positive_data_filtered = np.array([])
+            negative_data_filtered = np.array([])
+
+        all_data = np.concatenate(
+            [positive_data_filtered, negative_data_filtered, unknown_data_filtered]
+        )
+        if all_data.size > 0:
+            range_min = math.floor(all_data.min() - 1)
+            range_max = math.ceil(all_data.max() + 1)
+        else:
+            range_min = 0
+            range_max = 100  # Default range if no data
+
+        # Store data
+        labeled_data[col] = {
+            "positive": {"data": np.sort(positive_data_filtered)},
+            "negative": {"data": np.sort(negative_data_filtered)},
+            "unknown": {"data": np.sort(unknown_data_filtered)},
+            "range_min": range_min,
+            "range_max": range_max,
+        }
+    return labeled_data
+
+
+def calculate_bin_edges(
+    range_value, range_min, range_max, margin=0.5, max_bins=MAX_HISTOGRAM_BINS
+):
+    # 100 bins across the visible range, only the viewport and a margin of
+    # `margin` viewport widths on each side get edges, so zooming into a wide
+    # column costs the same as the default view
+    num_bins_on_screen = 100
+
+    visible_range_width = range_value[1] - range_value[0]
+    if not visible_range_width > 0:
+        visible_range_width = (range_max - range_min) or 1.0
+    step = visible_range_width / num_bins_on_screen
+
+    low = max(range_min, range_value[0] - margin * visible_range_width)
+    high = min(range_max, range_value[1] + margin * visible_range_width)
+    start = np.floor(low / step) * step
+    stop = np.ceil(high / step) * step
+
+    num_bins = min(max(int(round((stop - start) / step)), 1), max_bins)
+    bin_edges = np.linspace(start, start + num_bins * step, num_bins + 1)
+    return bin_edges
+
+
+def histogram_density(sorted_data, bin_edges):
+    # same bins as np.histogram (the last one closed) from the positions of the
+    # edges in the sorted class data, O(bins log N) instead of O(N). Density is
+    # relative to all samples of the class, not only those inside the edges, so
+    # bar heights do not change while the viewport moves.
+    positions = np.searchsorted(sorted_data, bin_edges, side="left")
+    positions[-1] = np.searchsorted(sorted_data, bin_edges[-1], side="right")
+    counts = np.diff(positions)
+    if len(sorted_data) == 0:
+        return np.zeros(counts.size)
+    return counts / (len(sorted_data) * np.diff(bin_edges))
+
+
+def kde_bandwidth(sorted_data):
+    # Silverman's rule of thumb, robust to outliers through the IQR
+    n = len(sorted_data)
+    std = np.std(sorted_data)
+    iqr = np.quantile(sorted_data, 0.75) - np.quantile(sorted_data, 0.25)
+    spread = min(std, iqr / 1.34) if iqr > 0 else std
+    if spread <= 0:
+        # all samples equal, any narrow peak will do
+        spread = max(abs(float(sorted_data[0])), 1.0) * 0.01
+    return 0.9 * spread * n ** (-1 / 5)
+
+
+def kde_grid(sorted_data, bandwidth=None, grid_size=KDE_GRID_SIZE):
+    # Gaussian kernel density on an even grid over the class, (grid, density).
+    # The samples are binned linearly onto the grid and the bin weights
+    # convolved with the kernel by FFT, O(N + G log G) instead of O(N * G) for
+    # the exact sum. None for an empty class.
+    n = len(sorted_data)
+    if n == 0:
+        return None
+    if bandwidth is None:
+        bandwidth = kde_bandwidth(sorted_data)
+    low = float(sorted_data[0]) - 4 * bandwidth
+    high = float(sorted_data[-1]) + 4 * bandwidth
+    grid = np.linspace(low, high, grid_size)
+    delta = grid[1] - grid[0]
+
+    # each sample split between its two neighbouring grid points
+    position = (np.asarray(sorted_data, dtype=float) - low) / delta
+    index = np.clip(np.floor(position).astype(np.int64), 0, grid_size - 2)
+    weight = position - index
+    counts = np.bincount(index, 1 - weight, minlength=grid_size)
+    counts += np.bincount(index + 1, weight, minlength=grid_size)
+
+    # kernel cut off at 4 bandwidths, zero padded so the convolution is linear
+    half_width = min(grid_size - 1, int(np.ceil(4 * bandwidth / delta)))
+    offsets = np.arange(-half_width, half_width + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= n * bandwidth * np.sqrt(2 * np.pi)
+    size = 1 << int(np.ceil(np.log2(grid_size + 2 * half_width)))
+    density = np.fft.irfft(
+        np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size
+    )[half_width : half_width + grid_size]
+    # rounding leaves tiny negative values where the density is zero
+    return grid, np.clip(density, 0, None)
+
+
+# mistitled, more like count labels at each point
+def make_roc_curve(labeled_data):
+    # view confusion matrix chart @ https://en.wikipedia.org/wiki/Receiver_operating_characteristic
+    roc_curves = {}
+    for column, data in labeled_data.items():
+        positive_data = data["positive"]["data"]
+        negative_data = data["negative"]["data"]
+        unknown_data = data["unknown"]["data"]
+
+        pos_median = np.median(positive_data)
+        neg_median = np.median(negative_data)
+        mirrored = pos_median <= neg_median
+
+        # if mirrored:
+        #     positive_data = -positive_data
+        #     negative_data = -negative_data
+        #     unknown_data = -unknown_data
+
+        total_positive = len(positive_data)
+        total_negative = len(negative_data)
+        total_unknown = len(unknown_data)
+
+        if total_positive == 0 and total_positive == 0:
+            roc_curves[column] = {
+                "population_data": [],
+                "total_positive": 0,
+                "total_negative": 0,
+                "total_unknown": 0,
+                "accumulated_positive_at_value": [],
+                "accumulated_negative_at_value": [],
+                "accumulated_unknown_at_value": [],
+                "mirrored": False,
+            }
+            continue
+
+        # make list of formated data values: tuple (value, True/False)
+        positive_tuples = [(value, True) for value in positive_data]
+        negative_tuples = [(value, False) for value in negative_data]
+        unknown_tuples = [(value, None) for value in unknown_data]
+
+        # create a sorted master list of all categories
+        population_data = sorted(
+            positive_tuples + negative_tuples + unknown_tuples, key=lambda x: x[0]
+        )
+
+        current_positive_count = 0
+        current_negative_count = 0
+        current_unknown_count = 0
+
+        accumulated_positive_at_value = []
+        accumulated_negative_at_value = []
+        accumulated_unknown_at_value = []
+
+        for value, label in population_data:
+            if label is True:
+                current_positive_count += 1
+            elif label is False:
+                current_negative_count += 1
+            elif label is None:
+                current_unknown_count += 1
+
+            accumulated_positive_at_value.append(current_positive_count)
+            accumulated_negative_at_value.append(current_negative_count)
+            accumulated_unknown_at_value.append(current_unknown_count)
+
+        roc_curves[column] = {
+            "population_data": population_data,
+            "total_positive": total_positive,
+            "total_negative": total_negative,
+            "total_unknown": total_unknown,
+            "accumulated_positive_at_value": accumulated_positive_at_value,
+            "accumulated_negative_at_value": accumulated_negative_at_value,
+            "accumulated_unknown_at_value": accumulated_unknown_at_value,
+            "mirrored": mirrored,
+        }
+    return roc_curves
+
+
+def merge_sorted(sorted_data, new_data):
+    # sorted_data with new_data inserted in order, only the new values are sorted
+    new_data = np.sort(np.asarray(new_data, dtype=float))
+    sorted_data = np.asarray(sorted_data, dtype=float)
+    positions = np.searchsorted(sorted_data, new_data, side="right")
+    return np.insert(sorted_data, positions, new_data)
+
+
+def append_labeled_data(labeled_data, df):
+    # labeled_data of the earlier rows plus the rows of df (same columns), the
+    # earlier rows are neither relabeled nor sorted again
+    new_labeled_data = label_data(df)
+    merged = {}
+    for column, data in labeled_data.items():
+        new = new_labeled_data[column]
+        merged[column] = {
+            label: {"data": merge_sorted(data[label]["data"], new[label]["data"])}
+            for label in ("positive", "negative", "unknown")
+        }
+        if len(df):
+            merged[column]["range_min"] = min(data["range_min"], new["range_min"])
+            merged[column]["range_max"] = max(data["range_max"], new["range_max"])
+        else:
+            merged[column]["range_min"] = data["range_min"]
+            merged[column]["range_max"] = data["range_max"]
+    return merged
+
+
+def roc_curve_from_sorted(data):
+    # make_roc_curve for one column of labeled data, with numpy instead of a
+    # sort of python tuples. The classes are already sorted, so the stable sort
+    # of the three runs is a merge (ties keep positives, negatives, unknowns).
+    classes = [
+        np.asarray(data[label]["data"], dtype=float)
+        for label in ("positive", "negative", "unknown")
+    ]
+    positive, negative, unknown = classes
+    if positive.size == 0:
+        # same as make_roc_curve, which checks total_positive only
+        return {
+            "population_data": [],
+            "total_positive": 0,
+            "total_negative": 0,
+            "total_unknown": 0,
+            "accumulated_positive_at_value": [],
+            "accumulated_negative_at_value": [],
+            "accumulated_unknown_at_value": [],
+            "mirrored": False,
+        }
+
+    values = np.concatenate(classes)
+    labels = np.repeat(np.arange(3), [c.size for c in classes])
+    order = np.argsort(values, kind="stable")
+    values, labels = values[order], labels[order]
+    label_objects = np.array([True, False, None], dtype=object)[labels]
+
+    return {
+        "population_data": list(zip(values.tolist(), label_objects.tolist())),
+        "total_positive": int(positive.size),
+        "total_negative": int(negative.size),
+        "total_unknown": int(unknown.size),
+        "accumulated_positive_at_value": np.cumsum(labels == 0),
+        "accumulated_negative_at_value": np.cumsum(labels == 1),
+        "accumulated_unknown_at_value": np.cumsum(labels == 2),
+        "mirrored": bool(
+            negative.size and np.median(positive) <= np.median(negative)
+        ),
+    }
+
+
+def reference_label(reference_result):
+    # class of a reference_result value, missing values are unknown like in
+    # label_data
+    if reference_result is None or reference_result != reference_result:
+        return "unknown"
+    if reference_result > 0:
+        return "positive"
+    if reference_result < 0:
+        return "negative"
+    return "unknown"
+
+
+def _remove_sorted(sorted_data, values, label):
+    # sorted_data without one sample of each of values, equal values remove as
+    # many equal samples
+    values = np.sort(np.asarray(values, dtype=float))
+    rank = np.arange(values.size) - np.searchsorted(values, values, side="left")
+    positions = np.searchsorted(sorted_data, values, side="left") + rank
+    found = positions < sorted_data.size
+    found[found] = sorted_data[positions[found]] == values[found]
+    if not found.all():
+        raise ValueError(f"no {label} sample of {values[~found][0]}")
+    return np.delete(sorted_data, positions)
+
+
+def relabel_samples(column_data, roc_data, moves):
+    # move samples of a column between classes, moves is [(value, old_label,
+    # new_label)], changing column_data (label_data) and roc_data
+    # (make_roc_curve) in place. Each class array is rebuilt once per batch,
+    # the changed values are found in the population by binary search and the
+    # cumulative counts after them shifted with numpy, nothing is sorted again.
+    labels = ("positive", "negative", "unknown")
+    moves = [move for move in moves if move[1] != move[2]]
+    if not moves:
+        return
+    for label in labels:
+        data = np.asarray(column_data[label]["data"], dtype=float)
+        removed = [value for value, old, _ in moves if old == label]
+        added = [value for value, _, new in moves if new == label]
+        if removed:
+            data = _remove_sorted(data, removed, label)
+        if added:
+            data = merge_sorted(data, added)
+        column_data[label]["data"] = data
+
+    if roc_data["total_positive"] == 0 or column_data["positive"]["data"].size == 0:
+        # make_roc_curve leaves columns without positives empty
+        roc_data.clear()
+        roc_data.update(roc_curve_from_sorted(column_data))
+        return
+
+    population = roc_data["population_data"]
+    size = len(population)
+    acc = {}
+    for label in labels:
+        name = f"accumulated_{label}_at_value"
+        acc[label] = roc_data[name] = np.asarray(roc_data[name], dtype=np.int64)
+
+    # net change of every class per changed value
+    changes = {}
+    for value, old_label, new_label in moves:
+        change = changes.setdefault(value, dict.fromkeys(labels, 0))
+        change[old_label] -= 1
+        change[new_label] += 1
+
+    # samples of a value are a group of the population, the counts after a
+    # group change by its net change
+    groups = []
+    shift = {label: np.zeros(size, dtype=np.int64) for label in labels}
+    for value, change in changes.items():
+        low = bisect.bisect_left(population, value, key=lambda p: p[0])
+        high = bisect.bisect_right(population, value, key=lambda p: p[0])
+        if low == high:
+            raise ValueError(f"no sample of {value} in the roc curve")
+        counts = {}
+        for label in labels:
+            before = acc[label][low - 1] if low > 0 else 0
+            counts[label] = int(acc[label][high - 1] - before) + change[label]
+            if counts[label] < 0:
+                raise ValueError(f"no {label} sample of {value} in the roc curve")
+            if high < size:
+                shift[label][high] += change[label]
+        groups.append((low, high, value, counts))
+    for label in labels:
+        acc[label] += np.cumsum(shift[label])
+
+    # in a group positives come first, then negatives and unknowns (as sorted
+    # by make_roc_curve). Left to right, so the count before a group is final.
+    markers = {"positive": True, "negative": False, "unknown": None}
+    for low, high, value, counts in sorted(groups, key=lambda group: group[0]):
+        order = np.repeat(np.arange(len(labels)), [counts[l] for l in labels])
+        for i, label in enumerate(labels):
+            before = acc[label][low - 1] if low > 0 else 0
+            acc[label][low:high] = before + np.cumsum(order == i)
+        population[low:high] = [(value, markers[labels[i]]) for i in order]
+
+    for label in labels:
+        roc_data[f"total_{label}"] = int(column_data[label]["data"].size)
+    positive = column_data["positive"]["data"]
+    negative = column_data["negative"]["data"]
+    roc_data["mirrored"] = bool(
+        negative.size and np.median(positive) <= np.median(negative)
+    )
+
+
+def roc_curve_points(roc_data, threshold_index):
+    # the step ROC curve as drawn in the app, with the point of the threshold at
+    # threshold_index, None without positive and negative samples
+    population_data = roc_data["population_data"]
+    total_positive = roc_data["total_positive"]
+    total_negative = roc_data["total_negative"]
+    acc_pos = roc_data["accumulated_positive_at_value"]
+    acc_neg = roc_data["accumulated_negative_at_value"]
+    mirrored = roc_data["mirrored"]
+
+
+    TPR_plot = [1]
+    FPR_plot = [0]
+    threshold_plot = [population_data[0][0]]
+
+    if total_positive == 0 and total_negative == 0:
+        return None
+
+    for k, pop in enumerate(population_data):
+        positives_less_than_current_value = acc_pos[k - 1] if k > 0 else 0
+        negatives_less_than_current_value = acc_neg[k - 1] if k > 0 else 0
+
+        tp_at_k = total_positive - positives_less_than_current_value
+        fp_at_k = total_negative - negatives_less_than_current_value
+
+        tpr_at_k = tp_at_k / total_positive if total_positive > 0 else 0
+        fpr_at_k = 1 - (fp_at_k / total_negative) if total_negative > 0 else 0
+
+        TPR_plot.append(tpr_at_k)
+        FPR_plot.append(fpr_at_k)
+        threshold_plot.append(pop[0])
+
+    TPR_plot.append(0)
+    FPR_plot.append(1)
+
+    if mirrored:
+        _mirrored_TPR_plot = [1-p for p in TPR_plot]
+        _mirrored_FPR_plot = [1-p for p in FPR_plot]
+        TPR_plot = _mirrored_TPR_plot
+        FPR_plot = _mirrored_FPR_plot
+
+        threshold_plot.append(population_data[-1][0])
+
+        thresh_pt_x = 0
+        thresh_pt_y = 0
+
+        if total_positive == 0 and total_negative == 0:
+            pass
+        elif threshold_index == len(population_data):
+            thresh_pt_x = 0
+            thresh_pt_y = 1
+        elif threshold_index == 0:
+            thresh_pt_x = 1
+            thresh_pt_y = 0
+        else:
+            thresh_pt_x = FPR_plot[threshold_index+1]
+            thresh_pt_y = TPR_plot[threshold_index+1]
+
+        threshold = population_data[threshold_index][0]
+
+
+    else:
+        threshold_plot.append(population_data[-1][0])
+
+        thresh_pt_x = 0
+        thresh_pt_y = 0
+
+        if total_positive == 0 and total_negative == 0:
+            pass
+        elif threshold_index == len(population_data):
+            thresh_pt_x = 1
+            thresh_pt_y = 0
+        elif threshold_index == 0:
+            thresh_pt_x = 0
+            thresh_pt_y = 1
+        else:
+            thresh_pt_x = FPR_plot[threshold_index + 1]
+            thresh_pt_y = TPR_plot[threshold_index + 1]
+
+        threshold = population_data[threshold_index][0]
+
+    return {
+        "tnr": FPR_plot,
+        "tpr": TPR_plot,
+        "thresholds": threshold_plot,
+        "threshold_point": (thresh_pt_x, thresh_pt_y),
+        "threshold": threshold,
+        "mirrored": mirrored,
+    }
+
+
+def roc_table(roc_data):
+    # the ROC curve as a table, the output of the command line tool
+    points = roc_curve_points(roc_data, 0)
+    df = pd.DataFrame(
+        {
+            "TNR(x)": points["tnr"],
+            "TPR(y)": points["tpr"],
+            "threshold": points["thresholds"],
+        }
+    )
+    return df.drop_duplicates(subset=["TNR(x)", "TPR(y)"], keep="last")
+
+
+def roc_arrays(roc_data):
+    # ROC points at every distinct value, samples >= threshold are called positive
+    # (below the threshold when mirrored), same orientation as plot_roc_curve
+    values = np.fromiter((p[0] for p in roc_data["population_data"]), dtype=float)
+    return roc_arrays_from_counts(
+        values,
+        np.asarray(roc_data["accumulated_positive_at_value"], dtype=float),
+        np.asarray(roc_data["accumulated_negative_at_value"], dtype=float),
+        roc_data["total_positive"],
+        roc_data["total_negative"],
+        roc_data["mirrored"],
+    )
+
+
+def roc_arrays_from_counts(
+    values, acc_pos, acc_neg, total_positive, total_negative, mirrored
+):
+    # same as roc_arrays, from the sorted values and the cumulative counts
+    thresholds, first = np.unique(values, return_index=True)
+    pos_below = np.where(first > 0, acc_pos[first - 1], 0)
+    neg_below = np.where(first > 0, acc_neg[first - 1], 0)
+
+    tpr = (total_positive - pos_below) / max(total_positive, 1)
+    tnr = neg_below / max(total_negative, 1)
+
+    # everything below the last threshold
+    tpr = np.append(tpr, 0.0)
+    tnr = np.append(tnr, 1.0)
+    thresholds = np.append(thresholds, thresholds[-1] if thresholds.size else np.nan)
+
+    if mirrored:
+        tpr = 1 - tpr
+        tnr = 1 - tnr
+
+    return tnr, tpr, thresholds
+
+
+def roc_auc(tnr, tpr):
+    # area under TPR over FPR, ties between classes count as half. The curve
+    # falls as TNR rises, so points of equal TNR run from high to low TPR,
+    # whatever order the thresholds came in (mirrored columns are reversed)
+    order = np.lexsort((-tpr, tnr))
+    return float(_trapezoid(tpr[order], tnr[order]))
+
+
+def decimate_roc(tnr, tpr, thresholds, max_points=400):
+    # drop repeated points (values with only unknown samples)
+    keep = np.ones(tnr.size, dtype=bool)
+    keep[1:] = (np.diff(tnr) != 0) | (np.diff(tpr) != 0)
+    tnr, tpr, thresholds = tnr[keep], tpr[keep], thresholds[keep]
+
+    # drop points in the middle of straight horizontal or vertical runs
+    if tnr.size > 2:
+        keep = np.ones(tnr.size, dtype=bool)
+        same_x = (tnr[1:-1] == tnr[:-2]) & (tnr[1:-1] == tnr[2:])
+        same_y = (tpr[1:-1] == tpr[:-2]) & (tpr[1:-1] == tpr[2:])
+        keep[1:-1] = ~(same_x | same_y)
+        tnr, tpr, thresholds = tnr[keep], tpr[keep], thresholds[keep]
+
+    if tnr.size > max_points:
+        index = np.unique(np.linspace(0, tnr.size - 1, max_points).round().astype(int))
+        tnr, tpr, thresholds = tnr[index], tpr[index], thresholds[index]
+
+    return tnr, tpr, thresholds
+
+
+def midranks(values):
+    # ranks from 1, tied values share the mean of their ranks
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    return (np.cumsum(counts) - (counts - 1) / 2)[inverse]
+
+
+def delong(positive, negative):
+    # AUCs and their covariance matrix for paired scores, rows are columns and
+    # samples are the same cases in every row (fast DeLong of Sun and Xu 2014,
+    # O(N log N) per column through midranks instead of all pairs)
+    positive = np.atleast_2d(np.asarray(positive, dtype=float))
+    negative = np.atleast_2d(np.asarray(negative, dtype=float))
+    m, n = positive.shape[1], negative.shape[1]
+    k = positive.shape[0]
+
+    aucs = np.empty(k)
+    v10 = np.empty((k, m))  # share of negatives below each positive
+    v01 = np.empty((k, n))  # share of positives above each negative
+    for r in range(k):
+        ranks_pos = midranks(positive[r])
+        ranks_neg = midranks(negative[r])
+        ranks_all = midranks(np.concatenate([positive[r], negative[r]]))
+        aucs[r] = (ranks_all[:m].sum() - m * (m + 1) / 2) / (m * n)
+        v10[r] = (ranks_all[:m] - ranks_pos) / n
+        v01[r] = 1 - (ranks_all[m:] - ranks_neg) / m
+
+    covariance = np.atleast_2d(np.cov(v10)) / m + np.atleast_2d(np.cov(v01)) / n
+    return aucs, covariance
+
+
+def delong_compare(df, columns):
+    # paired DeLong tests between all pairs of columns on the rows where every
+    # column has a value and reference_result is positive or negative. Columns
+    # are oriented like make_roc_curve, so the AUCs are those of the ROC plot.
+    # {"aucs", "covariance", "positives", "negatives", "pairs": [{"a", "b",
+    # "difference", "covariance", "se", "z", "p"}]}, None with too few rows.
+    rows = df[list(columns) + ["reference_result"]].dropna()
+    rows = rows[rows["reference_result"] != 0]
+    is_positive = (rows["reference_result"] > 0).to_numpy()
+    scores = rows[list(columns)].to_numpy(dtype=float).T
+    positive, negative = scores[:, is_positive], scores[:, ~is_positive]
+    if positive.shape[1] < 2 or negative.shape[1] < 2:
+        return None
+
+    mirrored = np.median(positive, axis=1) <= np.median(negative, axis=1)
+    sign = np.where(mirrored, -1.0, 1.0)[:, None]
+    aucs, covariance = delong(positive * sign, negative * sign)
+
+    pairs = []
+    for i in range(len(columns)):
+        for j in range(i + 1, len(columns)):
+            variance = covariance[i, i] + covariance[j, j] - 2 * covariance[i, j]
+            difference = aucs[i] - aucs[j]
+            se = math.sqrt(max(variance, 0.0))
+            z = float(difference / se) if se > 0 else float("nan")
+            p = math.erfc(abs(z) / math.sqrt(2)) if se > 0 else float("nan")
+            pairs.append(
+                {
+                    "a": columns[i],
+                    "b": columns[j],
+                    "difference": float(difference),
+                    "covariance": float(covariance[i, j]),
+                    "se": se,
+                    "z": z,
+                    "p": p,
+                }
+            )
+    return {
+        "aucs": dict(zip(columns, aucs.tolist())),
+        "covariance": covariance,
+        "positives": int(positive.shape[1]),
+        "negatives": int(negative.shape[1]),
+        "pairs": pairs,
+    }
+
+
+def _condition_mask(values, condition):
+    # rows of one column passing one AG Grid filter, a combined filter has
+    # "operator" and "conditions". Blank cells only pass "blank", as in the grid.
+    if "conditions" in condition:
+        masks = [_condition_mask(values, c) for c in condition["conditions"]]
+        if condition.get("operator", "AND") == "OR":
+            return np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    filter_type, kind = condition.get("filterType"), condition.get("type")
+    blank = values.isna().to_numpy()
+    if filter_type == "set":
+        return values.isin(condition.get("values", [])).to_numpy()
+    if filter_type == "text":
+        text = values.astype("string").str.lower()
+        blank = blank | (text == "").fillna(True).to_numpy(dtype=bool)
+        names, parse = ("filter",), lambda value: str(value).lower()
+        operations = {
+            "equals": lambda value, _: text == value,
+            "notEqual": lambda value, _: text != value,
+            "contains": lambda value, _: text.str.contains(value, regex=False),
+            "notContains": lambda value, _: ~text.str.contains(value, regex=False),
+            "startsWith": lambda value, _: text.str.startswith(value),
+            "endsWith": lambda value, _: text.str.endswith(value),
+        }
+    elif filter_type in ("number", "date"):
+        if filter_type == "number":
+            numbers = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+            names, parse = ("filter", "filterTo"), float
+        else:
+            numbers = pd.to_datetime(values, errors="coerce")
+            names, parse = ("dateFrom", "dateTo"), pd.Timestamp
+        operations = {
+            "equals": lambda low, _: numbers == low,
+            "notEqual": lambda low, _: numbers != low,
+            "lessThan": lambda low, _: numbers < low,
+            "lessThanOrEqual": lambda low, _: numbers <= low,
+            "greaterThan": lambda low, _: numbers > low,
+            "greaterThanOrEqual": lambda low, _: numbers >= low,
+            # both ends excluded, the grid's default
+            "inRange": lambda low, high: (numbers > low) & (numbers < high),
+        }
+        blank = blank | np.asarray(pd.isna(numbers))
+    else:
+        raise ValueError(f"unsupported filter type: {filter_type}")
+
+    if kind == "blank":
+        return blank
+    if kind == "notBlank":
+        return ~blank
+    if kind not in operations:
+        raise ValueError(f"unsupported {filter_type} filter: {kind}")
+    # the value of the condition, and the upper end of a range
+    bounds = [None, None]
+    for i, name in enumerate(names[: 2 if kind == "inRange" else 1]):
+        value = condition.get(name)
+        try:
+            bounds[i] = parse(value)
+        except (TypeError, ValueError):
+            bounds[i] = None
+        if value is None or pd.isna(bounds[i]):
+            raise ValueError(f"invalid {name} of a {filter_type} filter: {value!r}")
+    mask = operations[kind](*bounds)
+    if isinstance(mask, pd.Series):
+        mask = mask.fillna(False).to_numpy(dtype=bool)
+    return mask & ~blank
+
+
+def filter_mask(df, filter_model):
+    # rows of df passing an AG Grid filter model ({column: filter}), every
+    # column's filter has to pass. Raises ValueError for filters of unknown
+    # columns or types.
+    mask = np.ones(len(df), dtype=bool)
+    for column, condition in (filter_model or {}).items():
+        if column not in df.columns:
+            raise ValueError(f"unknown column: {column}")
+        mask &= _condition_mask(df[column], condition)
+    return mask
+
+
+def filtered_column(df, column, mask):
+    # label_data of a column on the rows of mask, None when the column is not
+    # numeric
+    rows = df.loc[mask, [c for c in (column, "reference_result") if c in df]]
+    return label_data(rows.dropna(subset=[column])).get(column)
+
+
+def bisect_population_w_threshold(pop_data, threshold_value, mirrored):
+    # bisect_left returns an insertion point `i` such that all `a[k]` for `k < i` have `a[k] < x`.
+    # And all `a[k]` for `k >= i` have `a[k] >= x`.
+    # This `i` directly tells us how many elements are strictly less than `threshold_value`.
+    index = bisect.bisect_left(pop_data, threshold_value)
+    return index
+
+def gen_roc_table(roc_data, threshold_value, norm_params):
+    if not roc_data:
+        # Return an empty figure or a figure with a message if data is not available
+        return None
+
+    population_data = roc_data["population_data"]
+    accumulated_positive_at_value = roc_data["accumulated_positive_at_value"]
+    accumulated_negative_at_value = roc_data["accumulated_negative_at_value"]
+    accumulated_unknown_at_value = roc_data["accumulated_unknown_at_value"]
+    mirrored = roc_data["mirrored"]
+
+
+    pop_data = [p[0] for p in population_data]  #  if p[1] is not None]
+    i = bisect_population_w_threshold(pop_data, threshold_value, mirrored)
+    pop_data = [p[0] for p in population_data if p[1] is not None]
+    i_without_unknown = bisect_population_w_threshold(pop_data, threshold_value, mirrored)
+
+    # if mirrored:
+    #     # population_data.reverse()
+    #     accumulated_positive_at_value.reverse()
+    #     accumulated_negative_at_value.reverse()
+    #     accumulated_unknown_at_value.reverse()
+
+    # Determine counts of samples *below* the threshold (classified as Negative)
+    # If i is 0, no points are below the threshold.
+    # Otherwise, accumulated_positive[i-1] gives the count of positives up to population_data[i-1].
+    if i == 0:
+        fn_val = 0
+        tn_val = 0
+        un_val = 0
+    else:
+        fn_val = accumulated_positive_at_value[i - 1]
+        tn_val = accumulated_negative_at_value[i - 1]
+        un_val = accumulated_unknown_at_value[i - 1]
+
+    # Determine counts of samples *at or above* the threshold (classified as Positive)
+    tp_val = (
+        (roc_data["total_positive"] - fn_val)
+        if roc_data["total_positive"] is not None
+        else 0
+    )
+    fp_val = (
+        (roc_data["total_negative"] - tn_val)
+        if roc_data["total_negative"] is not None
+        else 0
+    )
+    up_val = (
+        (roc_data["total_unknown"] - un_val)
+        if roc_data["total_unknown"] is not None
+        else 0
+    )
+
+    if mirrored:
+        tp_val, fn_val = fn_val, tp_val
+        fp_val, tn_val = tn_val, fp_val
+        up_val, un_val = un_val, up_val
+
+    tpr_val = (
+        round(tp_val / roc_data["total_positive"], 2)
+        if roc_data["total_positive"] > 0
+        else 0
+    )
+    fpr_val = (
+        round(fp_val / roc_data["total_negative"], 2)
+        if roc_data["total_negative"] > 0
+        else 0
+    )
+    tnr_val = (
+        round(tn_val / roc_data["total_negative"], 2)
+        if roc_data["total_negative"] > 0
+        else 0
+    )  # Specificity
+    fnr_val = (
+        round(fn_val / roc_data["total_positive"], 2)
+        if roc_data["total_positive"] > 0
+        else 0
+    )  # Miss Rate
+
+    total_classified = (roc_data["total_positive"] or 0) + (
+        roc_data["total_negative"] or 0
+    )
+    acc_val = (
+        round((tp_val + tn_val) / total_classified, 2) if total_classified > 0 else 0
+    )
+
+    mean = norm_params["loc"]
+    std = norm_params["scale"]
+    z_score = (threshold_value - mean) / std if std != 0 else float("nan")
+    z_score = round(z_score, 2)
+    try:
+        ppv = tp_val / (tp_val + fp_val)
+    except ZeroDivisionError:
+        ppv = float('nan')
+
+    roc_table_for_df = [
+        [
+            "TP",
+            "TN",
+            "FN",
+            "FP",
+            "Sensitivity (TPR)",
+            "Specificity (TNR)",
+            "Positive Predictions",
+            "Negative Predictions",
+            "Accuracy",
+            "PPV",
+            "Z-score",
+        ],
+        [
+            tp_val,
+            tn_val,
+            fn_val,
+            fp_val,
+            tpr_val,
+            tnr_val,
+            up_val,
+            un_val,
+            acc_val,
+            round(ppv, 2),
+            z_score,
+        ],
+    ]
+
+    df = pd.DataFrame(roc_table_for_df)
+    new_header = df.iloc[0]
+    df.columns = new_header
+    df = df[1:].reset_index(drop=True)
+
+    data = df.to_dict("records")
+    columns = [{"name": i, "id": i} for i in df.columns]
+
+    return data, columns, i
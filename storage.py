@@ -0,0 +1,266 @@
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+SAVED_FILE_NAMES = {
+    "roc curves": "roc_curves.pkl",
+    "raw data": "raw_data.feather",
+    "labeled data": "labeled_data.pkl",
+    "parameter fitting": "fitted_params.pkl",
+}
+
+# written next to the processed files but not required to view a dataset
+OPTIONAL_FILE_NAMES = {
+    "processing profile": "processing_profile.json",
+    "roc report": "roc_report.xlsx",
+}
+
+# absolute, so every server process sees the same folder whatever its working
+# directory
+DATA_FOLDER = os.path.abspath(os.environ.get("VV_DATA_FOLDER", "data"))
+
+# hidden, so they are never listed as datasets
+LOCK_FOLDER = os.path.join(DATA_FOLDER, ".locks")
+CACHE_FOLDER = os.path.join(DATA_FOLDER, ".cache")
+ARRAY_FOLDER = os.path.join(DATA_FOLDER, ".arrays")
+UPLOAD_FOLDER = os.path.join(DATA_FOLDER, ".uploads")
+
+# hash of the uploaded file a dataset folder was processed from
+SOURCE_HASH_FILE = ".source.sha1"
+
+# batches appended to a dataset after it was processed, the raw data of batch n
+# as n.feather next to the uploaded file
+APPEND_FOLDER = ".appends"
+
+# reference results changed in the file viewer, {row: reference_result} with
+# rows counted over raw_data_paths. Applied on top of the raw data when it is
+# read, so an edit does not rewrite a whole segment.
+RELABEL_FILE = ".relabels.json"
+
+# build and trash folders left behind by a crash are removed after this long
+LEFTOVER_SECONDS = 24 * 60 * 60
+
+
+def dataset_dir(filename):
+    return os.path.join(DATA_FOLDER, filename)
+
+
+def dataset_path(filename, name):
+    return os.path.join(DATA_FOLDER, filename, name)
+
+
+@contextlib.contextmanager
+def file_lock(name, shared=False):
+    # lock held across server processes and threads, released on exit
+    os.makedirs(LOCK_FOLDER, exist_ok=True)
+    path = os.path.join(LOCK_FOLDER, name + ".lock")
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        else:
+            # msvcrt has no shared locks, readers wait for each other too
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_atomic(path, write):
+    # write(f) into a temporary file next to path, then move it into place so
+    # readers in other processes never see a half written file
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix="." + os.path.basename(path) + "."
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def raw_data_paths(filename, folder=None):
+    # raw data of the upload and of every appended batch, oldest first
+    folder = folder or dataset_dir(filename)
+    paths = [os.path.join(folder, SAVED_FILE_NAMES["raw data"])]
+    append_dir = os.path.join(folder, APPEND_FOLDER)
+    if os.path.isdir(append_dir):
+        segments = [
+            name
+            for name in os.listdir(append_dir)
+            if name.endswith(".feather") and name[: -len(".feather")].isdigit()
+        ]
+        for name in sorted(segments, key=lambda name: int(name.split(".")[0])):
+            paths.append(os.path.join(append_dir, name))
+    return paths
+
+
+def read_relabels(filename, folder=None):
+    path = os.path.join(folder or dataset_dir(filename), RELABEL_FILE)
+    try:
+        with open(path) as f:
+            return {int(row): value for row, value in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def write_relabels(folder, relabels):
+    # replaced, not written through, the file may be linked to the published one
+    text = json.dumps({str(row): value for row, value in relabels.items()})
+    write_atomic(os.path.join(folder, RELABEL_FILE), lambda f: f.write(text.encode()))
+
+
+def link_dataset(filename, build_dir, skip=()):
+    # the published files in a build folder as hard links, so a new version
+    # shares them instead of copying or rewriting them. Names in skip are left
+    # out, they are written anew.
+    source_dir = dataset_dir(filename)
+    for root, _, files in os.walk(source_dir):
+        target_root = os.path.join(build_dir, os.path.relpath(root, source_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            if root == source_dir and name in skip:
+                continue
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            try:
+                os.link(source, target)
+            except OSError:
+                # file systems without hard links
+                shutil.copy2(source, target)
+
+
+def upload_path(filename):
+    return os.path.join(UPLOAD_FOLDER, filename)
+
+
+def stage_upload(filename, content):
+    # uploads wait here until data_processing publishes them with their
+    # processed files
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    write_atomic(upload_path(filename), lambda f: f.write(content))
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        while data := f.read(1024**2):
+            sha1.update(data)
+    return sha1.hexdigest()
+
+
+def published_hash(filename):
+    try:
+        with open(dataset_path(filename, SOURCE_HASH_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_hash(build_dir, source_hash):
+    with open(os.path.join(build_dir, SOURCE_HASH_FILE), "w") as f:
+        f.write(source_hash)
+
+
+def new_build_dir():
+    # hidden and inside the data folder, so it can be renamed into place
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    return tempfile.mkdtemp(dir=DATA_FOLDER, prefix=".build-")
+
+
+def _trash_path():
+    return os.path.join(DATA_FOLDER, f".trash-{uuid.uuid4().hex}")
+
+
+def publish(build_dir, filename):
+    # swap the finished folder in with renames, readers holding the shared lock
+    # see either the old or the new files, never a mix
+    trash = None
+    with file_lock(filename):
+        if os.path.exists(dataset_dir(filename)):
+            trash = _trash_path()
+            os.rename(dataset_dir(filename), trash)
+        os.rename(build_dir, dataset_dir(filename))
+    if trash:
+        shutil.rmtree(trash, ignore_errors=True)
+    cache_clear(filename)
+
+
+def remove_dataset(filename):
+    trash = _trash_path()
+    with file_lock(filename):
+        os.rename(dataset_dir(filename), trash)
+    shutil.rmtree(trash, ignore_errors=True)
+    cache_clear(filename)
+
+
+def remove_leftovers():
+    # trash is never read again, a build folder only once its process is gone
+    if not os.path.isdir(DATA_FOLDER):
+        return
+    now = time.time()
+    for name in os.listdir(DATA_FOLDER):
+        path = os.path.join(DATA_FOLDER, name)
+        if name.startswith(".trash-") or (
+            name.startswith(".build-")
+            and now - os.path.getmtime(path) > LEFTOVER_SECONDS
+        ):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def cache_get(key):
+    # on-disk cache shared by all server processes, None on a miss
+    path = os.path.join(CACHE_FOLDER, key + ".pkl")
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def cache_put(key, value):
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    write_atomic(
+        os.path.join(CACHE_FOLDER, key + ".pkl"), lambda f: pickle.dump(value, f)
+    )
+
+
+def cache_clear(filename):
+    # drop the cached entries and arrays of a dataset, their keys start with its
+    # name
+    prefix = cache_prefix(filename)
+    if os.path.isdir(CACHE_FOLDER):
+        for name in os.listdir(CACHE_FOLDER):
+            if name.startswith(prefix):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(CACHE_FOLDER, name))
+    if os.path.isdir(ARRAY_FOLDER):
+        for name in os.listdir(ARRAY_FOLDER):
+            if name.startswith(prefix):
+                shutil.rmtree(os.path.join(ARRAY_FOLDER, name), ignore_errors=True)
+
+
+def cache_prefix(filename):
+    # file names may contain characters that are awkward in paths
+    return hashlib.sha1(filename.encode("utf-8")).hexdigest()[:16] + "-"
@@ -0,0 +1,32 @@
+import pytest
+from dash.exceptions import PreventUpdate
+
+import coalesce
+
+
+@pytest.fixture(autouse=True)
+def ticket_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(coalesce, "TICKET_FOLDER", str(tmp_path))
+    monkeypatch.setattr(coalesce, "SETTLE_SECONDS", 0)
+
+
+@coalesce.latest_only
+def plot(request_seq, value, session_id):
+    return value
+
+
+def test_older_request_arriving_late_is_dropped():
+    assert plot(2, "new", "tab") == "new"
+    with pytest.raises(PreventUpdate):
+        plot(1, "old", "tab")
+    assert coalesce.latest_ticket("tab", "plot") == 2
+
+
+def test_sessions_are_separate():
+    assert plot(5, "a", "tab-a") == "a"
+    assert plot(1, "b", "tab-b") == "b"
+
+
+def test_without_session_or_number_runs():
+    assert plot(None, "x", "tab") == "x"
+    assert plot(1, "y", None) == "y"
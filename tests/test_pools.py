@@ -0,0 +1,12 @@
+import os
+import signal
+
+import pools
+
+
+def test_dead_worker_gets_a_new_pool():
+    first = pools.get_executor("test", 1)
+    pid = first.submit(os.getpid).result()
+    os.kill(pid, signal.SIGKILL)
+    assert pools.run("test", 1, [(pow, 2, 10)]) == [1024]
+    assert pools.get_executor("test", 1) is not first
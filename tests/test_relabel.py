@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import roc_core
+
+
+def make_df(rng, rows=400):
+    # rounded, so many samples share a value
+    return pd.DataFrame(
+        {
+            "a": np.round(rng.normal(size=rows), 1),
+            "b": rng.integers(0, 20, size=rows).astype(float),
+            "reference_result": rng.choice([-1, 0, 1], size=rows),
+        }
+    )
+
+
+def assert_same(labeled_data, roc_curves, df):
+    expected_data = roc_core.label_data(df.copy())
+    expected_curves = roc_core.make_roc_curve(expected_data)
+    for column, data in expected_data.items():
+        for label in ("positive", "negative", "unknown"):
+            np.testing.assert_array_equal(
+                labeled_data[column][label]["data"], data[label]["data"]
+            )
+        roc_data, expected = roc_curves[column], expected_curves[column]
+        assert [tuple(p) for p in roc_data["population_data"]] == [
+            tuple(p) for p in expected["population_data"]
+        ]
+        for name in expected:
+            if name.startswith("accumulated_"):
+                np.testing.assert_array_equal(roc_data[name], expected[name])
+            elif name != "population_data":
+                assert roc_data[name] == expected[name], name
+
+
+def relabel(df, labeled_data, roc_curves, edits):
+    moves = []
+    for row, reference_result in edits:
+        old = roc_core.reference_label(df.at[row, "reference_result"])
+        moves.append((row, old, roc_core.reference_label(reference_result)))
+        df.at[row, "reference_result"] = reference_result
+    for column, column_data in labeled_data.items():
+        roc_core.relabel_samples(
+            column_data,
+            roc_curves[column],
+            [(df.at[row, column], old, new) for row, old, new in moves],
+        )
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 50])
+def test_relabels_match_rebuild(batch_size):
+    rng = np.random.default_rng(batch_size)
+    df = make_df(rng)
+    labeled_data = roc_core.label_data(df.copy())
+    roc_curves = roc_core.make_roc_curve(labeled_data)
+    for _ in range(20):
+        # distinct rows, the app keeps the last edit of a row
+        rows = rng.choice(len(df), size=batch_size, replace=False)
+        edits = [(int(row), int(rng.choice([-1, 0, 1]))) for row in rows]
+        relabel(df, labeled_data, roc_curves, edits)
+        assert_same(labeled_data, roc_curves, df)
+
+
+def test_last_positive_removed_and_added_back():
+    df = pd.DataFrame(
+        {"a": [1.0, 2.0, 2.0, 3.0], "reference_result": [1, -1, 0, -1]}
+    )
+    labeled_data = roc_core.label_data(df.copy())
+    roc_curves = roc_core.make_roc_curve(labeled_data)
+    relabel(df, labeled_data, roc_curves, [(0, -1)])
+    assert roc_curves["a"]["population_data"] == []
+    relabel(df, labeled_data, roc_curves, [(2, 1), (3, 1)])
+    assert_same(labeled_data, roc_curves, df)
+
+
+def test_unknown_sample_raises():
+    df = pd.DataFrame({"a": [1.0, 2.0, 3.0], "reference_result": [1, -1, 0]})
+    labeled_data = roc_core.label_data(df.copy())
+    roc_curves = roc_core.make_roc_curve(labeled_data)
+    with pytest.raises(ValueError):
+        roc_core.relabel_samples(
+            labeled_data["a"], roc_curves["a"], [(5.0, "positive", "negative")]
+        )
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import roc_core
+
+
+def mann_whitney(positive, negative):
+    # share of positive/negative pairs ranked right, ties count as half
+    positive, negative = positive[:, None], negative[None, :]
+    return float(((positive > negative) + 0.5 * (positive == negative)).mean())
+
+
+def curve_auc(df):
+    roc_data = roc_core.make_roc_curve(roc_core.label_data(df.copy()))["a"]
+    tnr, tpr, _ = roc_core.roc_arrays(roc_data)
+    return roc_core.roc_auc(tnr, tpr), roc_data["mirrored"]
+
+
+def test_toy_mirrored_column():
+    df = pd.DataFrame(
+        {"a": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], "reference_result": [1, 1, -1, 1, -1, -1]}
+    )
+    auc, mirrored = curve_auc(df)
+    assert mirrored
+    assert auc == pytest.approx(8 / 9)
+
+
+@pytest.mark.parametrize("shift", [0.8, -0.8])
+def test_matches_mann_whitney(shift):
+    rng = np.random.default_rng(1)
+    reference = rng.choice([-1, 1], size=300)
+    # rounded, so many samples of both classes share a value
+    values = np.round(rng.normal(size=300) + (reference > 0) * shift, 1)
+    df = pd.DataFrame({"a": values, "reference_result": reference})
+    auc, mirrored = curve_auc(df)
+    assert mirrored == (shift < 0)
+    expected = mann_whitney(values[reference > 0], values[reference < 0])
+    if mirrored:
+        expected = 1 - expected
+    assert auc == pytest.approx(expected)
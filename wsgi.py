@@ -0,0 +1,20 @@
+"""WSGI entry point for running the app with several worker processes.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+import os
+
+from storage import DATA_FOLDER
+
+
+def create_app():
+    # every worker imports the app on its own, callbacks keep their state in
+    # the browser and the data folder, so the workers share nothing else
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    from app import app
+
+    return app.server
+
+
+application = create_app()